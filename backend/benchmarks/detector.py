@@ -0,0 +1,238 @@
+"""
+Offline speed and accuracy benchmark for the detector, CPU only.
+
+    python -m benchmarks.detector --backends pytorch onnx --batch-sizes 1 8 --imgsz 480 640
+    python -m benchmarks.detector --baseline benchmarks/results/detector-main.json
+
+Runs every backend x image size x batch size over a stable slice of
+`metadata.csv` (see detection.inference.parity.held_out_slice) and writes a
+JSON report with images/s, per-stage latency (decode, preprocess, forward,
+postprocess), peak RSS and per-class precision/recall of the top-1 box.
+Each configuration runs in its own spawned process, so its peak RSS covers
+that configuration alone (model load included) and not the high-water mark
+of the ones before it. With --baseline the run fails when throughput or accuracy regress.
+"""
+
+import os
+
+# Must happen before torch is imported anywhere.
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+import argparse
+import json
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+
+import numpy as np
+
+from detection.inference.backends import BACKENDS, DEFAULT_MODEL_PATHS, OnnxRuntimeBackend, build_backend
+from detection.inference.decode import decode_image
+from detection.inference.parity import held_out_slice, top_prediction
+from detection.processing.constants import CLASS_MAPPING
+
+STAGES = ("decode", "preprocess", "forward", "postprocess")
+
+
+def peak_rss_mb() -> float:
+    """High-water mark of this process; only meaningful in the per-configuration child."""
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def timed_predict(backend, images: list, imgsz: int):
+    """Runs one batch and returns `(boxes per image, {stage: ms for the whole batch})`."""
+    if isinstance(backend, OnnxRuntimeBackend):
+        t0 = time.perf_counter()
+        tensor, meta = backend.preprocess(images, imgsz)
+        t1 = time.perf_counter()
+        output = backend.forward(tensor)
+        t2 = time.perf_counter()
+        boxes = backend.postprocess(output, meta)
+        t3 = time.perf_counter()
+        return boxes, {"preprocess": (t1 - t0) * 1000, "forward": (t2 - t1) * 1000, "postprocess": (t3 - t2) * 1000}
+
+    # Ultralytics times its own stages per image.
+    results = backend.model(images, imgsz=imgsz, conf=backend.conf_threshold, iou=backend.iou_threshold,
+                            verbose=False)
+    boxes = [r.boxes.data.cpu().numpy().astype(np.float32) for r in results]
+    speed = results[0].speed if results else {}
+    n = len(images)
+    return boxes, {
+        "preprocess": speed.get("preprocess", 0.0) * n,
+        "forward": speed.get("inference", 0.0) * n,
+        "postprocess": speed.get("postprocess", 0.0) * n,
+    }
+
+
+def per_class_metrics(truth: list, predicted: list, names: dict) -> dict:
+    metrics = {}
+    for cls_id, name in sorted(names.items()):
+        tp = sum(t == cls_id and p == cls_id for t, p in zip(truth, predicted))
+        predicted_count = sum(p == cls_id for p in predicted)
+        true_count = sum(t == cls_id for t in truth)
+        metrics[name] = {
+            "support": true_count,
+            "precision": round(tp / predicted_count, 4) if predicted_count else None,
+            "recall": round(tp / true_count, 4) if true_count else None,
+        }
+    return metrics
+
+
+def run(backend, samples: list, imgsz: int, batch_size: int, max_pixels: int = 50_000_000,
+        early_downscale: bool = True) -> dict:
+    """`samples` is a list of `(encoded image bytes, true class id)`."""
+    target_size = imgsz if early_downscale else None
+    backend.warmup(imgsz)
+
+    totals = dict.fromkeys(STAGES, 0.0)
+    batch_latencies, truth, predicted = [], [], []
+    started = time.perf_counter()
+    for start in range(0, len(samples), batch_size):
+        chunk = samples[start:start + batch_size]
+        t0 = time.perf_counter()
+        images = [decode_image(data, max_pixels, target_size) for data, _ in chunk]
+        totals["decode"] += (time.perf_counter() - t0) * 1000
+
+        boxes, timings = timed_predict(backend, images, imgsz)
+        batch_latencies.append((time.perf_counter() - t0) * 1000)
+        for stage, ms in timings.items():
+            totals[stage] += ms
+
+        for (_, label), image_boxes in zip(chunk, boxes):
+            top = top_prediction(image_boxes)
+            truth.append(label)
+            predicted.append(top[0] if top else None)
+    elapsed = time.perf_counter() - started
+
+    n = len(samples)
+    return {
+        "backend": backend.name,
+        "imgsz": imgsz,
+        "batch_size": batch_size,
+        "threads": backend.threads,
+        "conf_threshold": backend.conf_threshold,
+        "iou_threshold": backend.iou_threshold,
+        "images": n,
+        "images_per_second": round(n / elapsed, 2),
+        "stage_ms_per_image": {stage: round(ms / n, 3) for stage, ms in totals.items()},
+        "batch_latency_ms": {
+            "p50": round(float(np.percentile(batch_latencies, 50)), 2),
+            "p95": round(float(np.percentile(batch_latencies, 95)), 2),
+        },
+        "top1_accuracy": round(sum(t == p for t, p in zip(truth, predicted)) / n, 4),
+        "per_class": per_class_metrics(truth, predicted, backend.names),
+    }
+
+
+def _run_in_child(kind: str, samples: list, imgsz: int, batch_size: int, args: argparse.Namespace) -> dict:
+    backend = build_backend(kind, getattr(args, f"{kind}_model"), threads=args.threads,
+                            conf_threshold=args.conf_threshold, iou_threshold=args.iou_threshold)
+    # Labels are mapped through the model's own class names.
+    ids_by_name = {v: k for k, v in backend.names.items()}
+    result = run(backend, [(data, ids_by_name.get(name)) for data, name in samples], imgsz, batch_size,
+                 args.max_pixels, not args.no_early_downscale)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def run_isolated(kind: str, samples: list, imgsz: int, batch_size: int, args: argparse.Namespace) -> dict:
+    """`run` in a fresh process; `samples` is a list of `(encoded image bytes, true class name)`."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        return executor.submit(_run_in_child, kind, samples, imgsz, batch_size, args).result()
+
+
+def load_samples(data_dir: str, fraction: float, limit: int) -> list:
+    df = held_out_slice(os.path.join(data_dir, "metadata.csv"), fraction, limit)
+    class_names = list(CLASS_MAPPING)
+    samples = []
+    for row in df.itertuples():
+        path = os.path.join(data_dir, "images", f"{row.image}.jpg")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                samples.append((f.read(), class_names[row.label]))
+    if not samples:
+        raise SystemExit(f"None of the selected images were found in {data_dir}/images")
+    return samples
+
+
+def regressions(results: list, baseline: dict, max_drop: float) -> list:
+    """Configurations that got slower or less accurate than in `baseline` by more than `max_drop`."""
+    previous = {(r["backend"], r["imgsz"], r["batch_size"]): r for r in baseline["results"]}
+    found = []
+    for result in results:
+        before = previous.get((result["backend"], result["imgsz"], result["batch_size"]))
+        if before is None:
+            continue
+        for metric in ("images_per_second", "top1_accuracy"):
+            if result[metric] < before[metric] * (1 - max_drop):
+                found.append(f"{result['backend']} imgsz={result['imgsz']} batch={result['batch_size']}: "
+                             f"{metric} {before[metric]} -> {result[metric]}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detector speed and accuracy on CPU.")
+    parser.add_argument("--backends", nargs="+", default=["pytorch"], choices=BACKENDS)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8])
+    parser.add_argument("--imgsz", nargs="+", type=int, default=[640])
+    for kind in BACKENDS:
+        parser.add_argument(f"--{kind}-model", default=DEFAULT_MODEL_PATHS[kind])
+    parser.add_argument("--threads", type=int, default=0, help="Same as INFERENCE_THREADS; 0 = all cores")
+    parser.add_argument("--conf-threshold", type=float, default=0.25, help="Same as DETECT_CONF_THRESHOLD")
+    parser.add_argument("--iou-threshold", type=float, default=0.7, help="Same as DETECT_IOU_THRESHOLD")
+    parser.add_argument("--max-pixels", type=int, default=50_000_000, help="Same as DETECT_MAX_PIXELS")
+    parser.add_argument("--no-early-downscale", action="store_true", help="As with DETECT_EARLY_DOWNSCALE=false")
+    parser.add_argument("--data-dir", default="detection/data")
+    parser.add_argument("--fraction", type=float, default=0.1, help="Share of metadata.csv to evaluate on")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--output", default=None, help="Defaults to benchmarks/results/detector-<timestamp>.json")
+    parser.add_argument("--baseline", default=None, help="Earlier report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.1, help="Allowed relative drop vs. the baseline")
+    args = parser.parse_args()
+
+    results = []
+    samples = load_samples(args.data_dir, args.fraction, args.limit)
+    for kind in args.backends:
+        for imgsz in args.imgsz:
+            for batch_size in args.batch_sizes:
+                result = run_isolated(kind, samples, imgsz, batch_size, args)
+                print(f"{kind:9s} imgsz={imgsz:<5d} batch={batch_size:<3d} "
+                      f"{result['images_per_second']:8.2f} img/s  acc={result['top1_accuracy']:.3f}  "
+                      f"rss={result['peak_rss_mb']} MB")
+                results.append(result)
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+        },
+        "args": vars(args),
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        "benchmarks", "results", f"detector-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.max_regression)
+        for line in found:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+In-process stand-ins used by the load test: an in-memory GridFS bucket, a
+mailer that only counts, and a detector that sleeps instead of running a model.
+"""
+
+import time
+from datetime import datetime, timezone
+from itertools import count
+
+import numpy as np
+from bson import ObjectId
+from gridfs.errors import NoFile
+
+from detection.processing.constants import CLASS_MAPPING
+
+
+class _GridIn:
+    def __init__(self, files: dict, filename: str, metadata: dict):
+        self._files = files
+        self._id = ObjectId()
+        self.filename = filename
+        self.metadata = metadata
+        self._chunks = []
+
+    async def write(self, data: bytes):
+        self._chunks.append(bytes(data))
+
+    async def close(self):
+        self._files[self._id] = {
+            "data": b"".join(self._chunks),
+            "filename": self.filename,
+            "metadata": self.metadata,
+            "upload_date": datetime.now(timezone.utc).replace(tzinfo=None),
+        }
+
+    async def abort(self):
+        self._chunks = []
+
+
+class _GridOut:
+    def __init__(self, file_id, entry: dict, chunk_size: int):
+        self._id = file_id
+        self._data = entry["data"]
+        self.length = len(self._data)
+        self.upload_date = entry["upload_date"]
+        self.metadata = entry["metadata"]
+        self._chunk_size = chunk_size
+        self._position = 0
+
+    def seek(self, position: int):
+        self._position = position
+
+    async def readchunk(self) -> bytes:
+        # Like GridFS, never read across a chunk boundary.
+        end = (self._position // self._chunk_size + 1) * self._chunk_size
+        chunk = self._data[self._position:end]
+        self._position += len(chunk)
+        return chunk
+
+    async def read(self) -> bytes:
+        chunk = self._data[self._position:]
+        self._position = self.length
+        return chunk
+
+
+class FakeGridFSBucket:
+    """The subset of AsyncIOMotorGridFSBucket the app uses, kept in memory."""
+
+    def __init__(self, chunk_size: int = 255 * 1024):
+        self.chunk_size = chunk_size
+        self._files: dict = {}
+
+    def open_upload_stream(self, filename, chunk_size_bytes=None, metadata=None):
+        return _GridIn(self._files, filename, metadata)
+
+    async def upload_from_stream(self, filename, source: bytes, metadata=None):
+        grid_in = self.open_upload_stream(filename, metadata=metadata)
+        await grid_in.write(source)
+        await grid_in.close()
+        return grid_in._id
+
+    async def open_download_stream(self, file_id):
+        entry = self._files.get(file_id)
+        if entry is None:
+            raise NoFile(f"no file with _id {file_id!r}")
+        return _GridOut(file_id, entry, self.chunk_size)
+
+    async def delete(self, file_id):
+        if self._files.pop(file_id, None) is None:
+            raise NoFile(f"no file with _id {file_id!r}")
+
+
+class FakeMailer:
+    def __init__(self):
+        self.sent = count()
+
+    async def send_email(self, to: str, subject: str, content: str):
+        next(self.sent)
+
+
+class FakeDetector:
+    """
+    Backend with the real interface whose forward pass is a sleep of
+    `forward_ms` per batch at imgsz 640, scaled by pixel count like a real
+    model, so admission's degraded size is cheaper here too.
+    """
+
+    name = "fake"
+    version = "fake"
+
+    def __init__(self, forward_ms: float = 30.0):
+        self.forward_ms = forward_ms
+        self.names = {v: k for k, v in CLASS_MAPPING.items()}
+
+    def predict(self, images: list, imgsz: int = 640):
+        time.sleep(self.forward_ms * (imgsz / 640) ** 2 / 1000)
+        results = []
+        for image in images:
+            h, w = image.shape[:2]
+            results.append(np.array([[w * 0.25, h * 0.25, w * 0.75, h * 0.75, 0.87, 1]], dtype=np.float32))
+        return results
+
+    def warmup(self, imgsz: int = 640):
+        pass
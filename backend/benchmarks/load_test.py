@@ -0,0 +1,369 @@
+"""
+HTTP load test for the API in main.py.
+
+    python -m benchmarks.load_test --rate 20 --duration 60
+    python -m benchmarks.load_test --rate 20 --baseline benchmarks/baselines/load_test.json
+    python -m benchmarks.load_test --target http://staging:8000 --rate 5
+
+Without --target the app is started in a subprocess with the mailer stubbed
+out and, unless --real-model is given, a detector that only sleeps for
+--forward-ms per batch (at imgsz 640). --fake-mongo swaps MongoDB and GridFS for in-process
+fakes (mongomock); otherwise the configured MongoDB is used, which should be a
+local, disposable one. That server is the real app, so it reads backend/.env
+like the API does; against --target nothing but requirements-dev.txt is needed.
+
+Requests arrive as a Poisson process at --rate per second and are spread over
+the routes by --mix. The report has throughput, p50/p95/p99 latency and error
+rate per route. With --baseline the run fails when a route's p95 or error
+rate regresses; --save-baseline writes the report there instead.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+
+PASSWORD = "Load-test-1!"
+DEFAULT_MIX = "detect=4,list=3,thumbnail=2,pdf=1,upload=1,login=1,signup=0.2"
+
+
+# --- server -----------------------------------------------------------------
+
+def serve(args):
+    """Runs the app in this process with the fakes installed."""
+    from benchmarks.fakes import FakeDetector, FakeGridFSBucket, FakeMailer
+
+    if args.fake_mongo:
+        from mongomock_motor import AsyncMongoMockClient
+        from internal.database import database
+
+        # The lifespan's connect() keeps a client that is already installed.
+        database.connect(AsyncMongoMockClient())
+        database.fs_bucket = FakeGridFSBucket()
+
+        from pymongo.errors import OperationFailure
+        from internal.tokens.cache import RevocationListener
+
+        async def no_change_streams(self):
+            raise OperationFailure("mongomock has no change streams", code=40573)
+
+        # Same path as a standalone mongod: revocations are polled.
+        RevocationListener._watch = no_change_streams
+
+    # Everything importing the database must come after the swap.
+    from internal.email import mailer
+
+    # Emails still go through the job queue; only the SMTP delivery is stubbed.
+    mailer.job_queue.register("send_email", FakeMailer().send_email)
+
+    import uvicorn
+    from main import app
+    from routes import detection
+
+    if not args.real_model:
+        detection.model_loader.factory = lambda: FakeDetector(args.forward_ms)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def start_server(args) -> subprocess.Popen:
+    command = [sys.executable, "-m", "benchmarks.load_test", "--serve", "--port", str(args.port),
+               "--forward-ms", str(args.forward_ms)]
+    command += ["--fake-mongo"] * args.fake_mongo + ["--real-model"] * args.real_model
+    env = dict(os.environ)
+    if args.fake_mongo:
+        # mongomock has no query planner to check.
+        env.update(MONGO_CHECK_QUERY_PLANS="false")
+    return subprocess.Popen(command, env=env)
+
+
+async def wait_until_up(client: httpx.AsyncClient, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/health/ready/detection")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.5)
+    raise SystemExit("Server did not become ready in time")
+
+
+# --- payloads -----------------------------------------------------------------
+
+def make_images(count: int, seed: int = 0) -> list:
+    """JPEG-encoded noise of phone-photo-like size; a small pool gives some cache hits."""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        pixels = rng.integers(0, 255, size=(450, 600, 3), dtype=np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(pixels).save(buf, format="JPEG", quality=85)
+        images.append(buf.getvalue())
+    return images
+
+
+PDF = b"%PDF-1.4\n" + b"0" * 40_000 + b"\n%%EOF\n"
+
+
+# --- load ---------------------------------------------------------------------
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, route: str, status, started: float):
+        self.latencies[route].append((time.perf_counter() - started) * 1000)
+        self.statuses[route][str(status)] += 1
+
+    def summary(self, elapsed: float) -> dict:
+        routes = {}
+        for route, latencies in sorted(self.latencies.items()):
+            statuses = dict(self.statuses[route])
+            errors = sum(n for status, n in statuses.items() if not status.startswith(("2", "3")))
+            routes[route] = {
+                "requests": len(latencies),
+                "throughput_rps": round(len(latencies) / elapsed, 2),
+                "error_rate": round(errors / len(latencies), 4),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+                "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 1),
+                "statuses": statuses,
+            }
+        return routes
+
+
+class Session:
+    """A signed-up user with a token and the reports it has uploaded."""
+
+    def __init__(self, email: str, token: str):
+        self.email = email
+        self.token = token
+        self.report_ids = []
+
+    @property
+    def headers(self):
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, images: list, recorder: Recorder):
+        self.client = client
+        self.images = images
+        self.recorder = recorder
+        self.sessions = []
+
+    async def request(self, route: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as exc:
+            self.recorder.record(route, type(exc).__name__, started)
+            return None
+        self.recorder.record(route, response.status_code, started)
+        return response
+
+    async def signup(self):
+        email = f"load-{uuid.uuid4().hex[:12]}@example.com"
+        body = {"name": "Load", "surname": "Tester", "email": email, "password": PASSWORD}
+        response = await self.request("POST /api/auth/signup", "POST", "/api/auth/signup", json=body)
+        if response is not None and response.status_code == 200:
+            await self.login(email)
+
+    async def login(self, email: str = None):
+        email = email or random.choice(self.sessions).email
+        body = {"email": email, "password": PASSWORD}
+        response = await self.request("POST /api/auth/login", "POST", "/api/auth/login", json=body)
+        if response is not None and response.status_code == 200:
+            token = response.json()["data"]["access_token"]
+            existing = next((s for s in self.sessions if s.email == email), None)
+            if existing:
+                existing.token = token
+            else:
+                self.sessions.append(Session(email, token))
+
+    async def detect(self):
+        files = {"file": ("lesion.jpg", random.choice(self.images), "image/jpeg")}
+        await self.request("POST /detect", "POST", "/detect", files=files)
+
+    async def upload(self, session: Session = None):
+        session = session or random.choice(self.sessions)
+        files = {
+            "image": ("lesion.jpg", random.choice(self.images), "image/jpeg"),
+            "pdf": ("report.pdf", PDF, "application/pdf"),
+        }
+        data = {"label": "NV", "confidence": "0.87", "risk_level": "Low risk", "advice": "Monitor for changes."}
+        response = await self.request("POST /api/reports/upload", "POST", "/api/reports/upload",
+                                      files=files, data=data, headers=session.headers)
+        if response is not None and response.status_code == 200:
+            session.report_ids.append(response.json()["data"]["report_id"])
+
+    async def list_reports(self):
+        session = random.choice(self.sessions)
+        await self.request("GET /api/reports/me", "GET", "/api/reports/me", headers=session.headers)
+
+    def _report(self):
+        sessions = [s for s in self.sessions if s.report_ids]
+        session = random.choice(sessions)
+        return session, random.choice(session.report_ids)
+
+    async def thumbnail(self):
+        session, report_id = self._report()
+        await self.request("GET /api/reports/image?size=thumb", "GET", f"/api/reports/image/{report_id}",
+                           params={"size": "thumb"}, headers=session.headers)
+
+    async def pdf(self):
+        session, report_id = self._report()
+        await self.request("GET /api/reports/pdf", "GET", f"/api/reports/pdf/{report_id}", headers=session.headers)
+
+    async def setup(self, users: int, reports_per_user: int):
+        for _ in range(users):
+            await self.signup()
+        if not self.sessions:
+            raise SystemExit("Could not sign up any user; is the server healthy?")
+        await asyncio.gather(*(self.upload(s) for s in self.sessions for _ in range(reports_per_user)))
+
+    async def run(self, rate: float, duration: float, mix: dict, max_in_flight: int) -> dict:
+        actions = {
+            "detect": self.detect, "list": self.list_reports, "thumbnail": self.thumbnail, "pdf": self.pdf,
+            "upload": self.upload, "login": self.login, "signup": self.signup,
+        }
+        names, weights = list(mix), list(mix.values())
+        in_flight, dropped, tasks = set(), 0, []
+
+        started = time.perf_counter()
+        next_at = started
+        while True:
+            next_at += random.expovariate(rate)
+            if next_at - started >= duration:
+                break
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            if len(in_flight) >= max_in_flight:
+                # Open-loop load: a request we cannot send in time counts as dropped, not delayed.
+                dropped += 1
+                continue
+            task = asyncio.create_task(actions[random.choices(names, weights)[0]]())
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+            tasks.append(task)
+        await asyncio.gather(*tasks)
+        return {"elapsed_seconds": round(time.perf_counter() - started, 2), "sent": len(tasks), "dropped": dropped}
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def regressions(routes: dict, baseline: dict, max_increase: float) -> list:
+    found = []
+    for route, before in baseline["routes"].items():
+        now = routes.get(route)
+        if now is None:
+            continue
+        if now["p95_ms"] > before["p95_ms"] * (1 + max_increase):
+            found.append(f"{route}: p95 {before['p95_ms']} ms -> {now['p95_ms']} ms")
+        if now["error_rate"] > before["error_rate"] + 0.01:
+            found.append(f"{route}: error rate {before['error_rate']} -> {now['error_rate']}")
+    return found
+
+
+async def main_async(args) -> int:
+    server = None if args.target else start_server(args)
+    base_url = args.target or f"http://127.0.0.1:{args.port}"
+    limits = httpx.Limits(max_connections=args.max_in_flight)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            await wait_until_up(client)
+            recorder = Recorder()
+            test = LoadTest(client, make_images(args.image_pool), recorder)
+            await test.setup(args.users, args.reports_per_user)
+            # Setup traffic is not part of the measurement.
+            test.recorder = recorder = Recorder()
+            load = await test.run(args.rate, args.duration, parse_mix(args.mix), args.max_in_flight)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    routes = recorder.summary(load["elapsed_seconds"])
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "machine": {"platform": platform.platform(), "cpu_count": os.cpu_count(), "python": platform.python_version()},
+        "args": {k: v for k, v in vars(args).items() if k not in ("serve", "baseline", "save_baseline")},
+        "load": load,
+        "routes": routes,
+    }
+    for route, stats in routes.items():
+        print(f"{route:40s} {stats['requests']:6d} req {stats['throughput_rps']:7.2f} rps  "
+              f"p50 {stats['p50_ms']:7.1f}  p95 {stats['p95_ms']:7.1f}  p99 {stats['p99_ms']:7.1f} ms  "
+              f"errors {stats['error_rate']:.2%}")
+
+    output = args.save_baseline or args.output
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(routes, json.load(f), args.max_regression)
+        for line in found:
+            print(f"REGRESSION {line}")
+        return 1 if found else 0
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the HTTP API.")
+    parser.add_argument("--target", default=None, help="Base URL of a running server; default starts one")
+    parser.add_argument("--port", type=int, default=8001, help="Port of the app started for the test")
+    parser.add_argument("--fake-mongo", action="store_true", help="Use in-process mongomock and GridFS fakes")
+    parser.add_argument("--real-model", action="store_true", help="Load the configured model instead of a fake")
+    parser.add_argument("--forward-ms", type=float, default=30.0, help="Fake detector time per batch at imgsz 640")
+    parser.add_argument("--rate", type=float, default=10.0, help="Requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Route weights, e.g. detect=4,list=3")
+    parser.add_argument("--max-in-flight", type=int, default=200)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--reports-per-user", type=int, default=2)
+    parser.add_argument("--image-pool", type=int, default=20, help="Distinct images sent to /detect and uploads")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", default="benchmarks/results/load_test.json")
+    parser.add_argument("--baseline", default=None, help="Report to compare against")
+    parser.add_argument("--save-baseline", default=None, help="Write the report here as the new baseline")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="Allowed relative p95 increase")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+    if not args.target:
+        from dotenv import find_dotenv
+
+        if not find_dotenv():
+            parser.error("the app started for the test needs backend/.env (see config/config.py); "
+                         "create one or pass --target")
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
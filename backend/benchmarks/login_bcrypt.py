@@ -0,0 +1,82 @@
+"""
+Login throughput and event-loop latency with bcrypt on vs. off the loop.
+
+    python -m benchmarks.login_bcrypt --logins 200 --concurrency 32
+
+Fires `--logins` password checks with `--concurrency` in flight, once calling
+bcrypt directly in the coroutine (how the auth routes used to do it) and once
+through `password_hasher`. Meanwhile a probe task sleeps for a few
+milliseconds in a loop; how late it wakes up is the latency any other request
+on the same worker would see.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import bcrypt
+import numpy as np
+
+from internal.utils.password_hasher import PasswordHasher
+
+
+async def probe(stop: asyncio.Event, interval: float, lags: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - started - interval) * 1000)
+
+
+async def run(mode: str, hasher: PasswordHasher, stored: str, logins: int, concurrency: int) -> dict:
+    password = "Correct-horse-1"
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def login():
+        async with semaphore:
+            started = time.perf_counter()
+            if mode == "inline":
+                ok = bcrypt.checkpw(password.encode("utf-8"), stored.encode("utf-8"))
+            else:
+                ok = await hasher.verify(password, stored)
+            assert ok
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    stop, lags = asyncio.Event(), []
+    probe_task = asyncio.create_task(probe(stop, 0.005, lags))
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe_task
+
+    return {
+        "mode": mode,
+        "logins_per_second": round(logins / elapsed, 1),
+        "login_p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "login_p99_ms": round(float(np.percentile(latencies, 99)), 1),
+        "loop_lag_p50_ms": round(float(np.percentile(lags, 50)), 1) if lags else None,
+        "loop_lag_p99_ms": round(float(np.percentile(lags, 99)), 1) if lags else None,
+        "loop_lag_max_ms": round(max(lags), 1) if lags else None,
+    }
+
+
+async def main_async(args):
+    hasher = PasswordHasher(rounds=args.rounds, max_workers=args.workers, max_pending=args.logins)
+    stored = await hasher.hash("Correct-horse-1")
+    results = [await run(mode, hasher, stored, args.logins, args.concurrency) for mode in ("inline", "offload")]
+    print(json.dumps({"rounds": args.rounds, "workers": args.workers, "results": results}, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bcrypt on and off the event loop.")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=4)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
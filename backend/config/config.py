@@ -2,6 +2,7 @@ from dotenv import load_dotenv, find_dotenv
 from internal.utils.logger import logger 
 from decouple import config
 import sys
+import os
 
 dotenv_path = find_dotenv()
 if not dotenv_path:
@@ -25,16 +26,136 @@ if conf["MONGODB_USER"] and conf["MONGODB_PASS"]:
 else:
     conf["MONGO_URI"] = f'mongodb://{conf["MONGODB_HOST"]}/{conf["MONGODB_DATABASE"]}'
 
+# Connections per API process; size against the number of uvicorn workers times this
+# (watch mongo_pool_wait_seconds and mongo_pool_checked_out in /metrics).
+conf["mongo_max_pool_size"] = int(config("MONGO_MAX_POOL_SIZE", default=100))
+conf["mongo_min_pool_size"] = int(config("MONGO_MIN_POOL_SIZE", default=0))
+conf["mongo_max_idle_time_ms"] = int(config("MONGO_MAX_IDLE_TIME_MS", default=0))
+conf["mongo_connect_timeout_ms"] = int(config("MONGO_CONNECT_TIMEOUT_MS", default=10000))
+conf["mongo_server_selection_timeout_ms"] = int(config("MONGO_SERVER_SELECTION_TIMEOUT_MS", default=10000))
+# 0 = no limit.
+conf["mongo_socket_timeout_ms"] = int(config("MONGO_SOCKET_TIMEOUT_MS", default=0))
+# How long a request waits for a free pooled connection; 0 = no limit.
+conf["mongo_wait_queue_timeout_ms"] = int(config("MONGO_WAIT_QUEUE_TIMEOUT_MS", default=0))
+# In order of preference; the ones whose Python module is missing are skipped.
+conf["mongo_compressors"] = config("MONGO_COMPRESSORS", default="zstd,snappy,zlib")
+conf["mongo_read_preference"] = config("MONGO_READ_PREFERENCE", default="primary")
+# Empty = the server default; a number or "majority".
+conf["mongo_write_concern"] = config("MONGO_WRITE_CONCERN", default="")
+conf["mongo_write_concern_timeout_ms"] = int(config("MONGO_WRITE_CONCERN_TIMEOUT_MS", default=0))
+
+conf["mongo_ensure_indexes"] = config("MONGO_ENSURE_INDEXES", default=True, cast=bool)
+# Refuse to start when a hot query would scan a whole collection.
+conf["mongo_check_query_plans"] = config("MONGO_CHECK_QUERY_PLANS", default=False, cast=bool)
+
 
 conf["secret_key"] = config("SECRET_KEY", default="super-secret-key")
 conf["algorithm"] = config("ALGORITHM", default="HS256")
 conf["access_token_expire_minutes"] = int(config("ACCESS_TOKEN_EXPIRE_MINUTES", default=15))
 conf["refresh_token_expire_days"] = int(config("REFRESH_TOKEN_EXPIRE_DAYS", default=7))
+conf["auth_token_cache_enabled"] = config("AUTH_TOKEN_CACHE_ENABLED", default=True, cast=bool)
+conf["auth_token_cache_max_entries"] = int(config("AUTH_TOKEN_CACHE_MAX_ENTRIES", default=10_000))
+conf["auth_token_cache_max_ttl_seconds"] = int(config("AUTH_TOKEN_CACHE_MAX_TTL_SECONDS", default=300))
+conf["auth_revocation_poll_seconds"] = float(config("AUTH_REVOCATION_POLL_SECONDS", default=2))
+# Trust the JWT signature and expiry alone; logout and revocation then have no effect until expiry.
+conf["auth_stateless"] = config("AUTH_STATELESS", default=False, cast=bool)
+conf["bcrypt_rounds"] = int(config("BCRYPT_ROUNDS", default=12))
+# 0 = min(4, CPU count).
+conf["bcrypt_max_workers"] = int(config("BCRYPT_MAX_WORKERS", default=0))
+# Queued + running hashes before new password requests are answered with 503.
+conf["bcrypt_max_pending"] = int(config("BCRYPT_MAX_PENDING", default=64))
 
 conf["smtp_host"] = config("SMTP_HOST", default="")
 conf["smtp_port"] = config("SMTP_PORT", default=587)
 conf["smtp_user"] = config("SMTP_USER", default="")
 conf["smtp_pass"] = config("SMTP_PASS", default="")
+# Implicit TLS on connect; when off, STARTTLS is used if the server offers it.
+conf["smtp_use_tls"] = config("SMTP_USE_TLS", default=True, cast=bool)
+conf["smtp_timeout"] = float(config("SMTP_TIMEOUT", default=30))
+# Open connections per process; keep it >= EMAIL_JOB_CONCURRENCY so email jobs never wait on the pool.
+conf["smtp_pool_size"] = int(config("SMTP_POOL_SIZE", default=4))
+# Pooled connections idle longer than this get a NOOP before reuse.
+conf["smtp_health_check_seconds"] = float(config("SMTP_HEALTH_CHECK_SECONDS", default=10))
+# ... and are closed instead after this long, before the server drops them itself.
+conf["smtp_max_idle_seconds"] = float(config("SMTP_MAX_IDLE_SECONDS", default=60))
+conf["smtp_max_messages_per_connection"] = int(config("SMTP_MAX_MESSAGES_PER_CONNECTION", default=100))
+conf["email_job_concurrency"] = int(config("EMAIL_JOB_CONCURRENCY", default=4))
+conf["email_job_max_attempts"] = int(config("EMAIL_JOB_MAX_ATTEMPTS", default=6))
+
+conf["job_poll_seconds"] = float(config("JOB_POLL_SECONDS", default=1))
+# A claimed job that has not finished after this long is handed to another worker.
+conf["job_lease_seconds"] = float(config("JOB_LEASE_SECONDS", default=300))
+conf["job_backoff_seconds"] = float(config("JOB_BACKOFF_SECONDS", default=5))
+conf["job_backoff_max_seconds"] = float(config("JOB_BACKOFF_MAX_SECONDS", default=600))
+conf["rendition_job_concurrency"] = int(config("RENDITION_JOB_CONCURRENCY", default=2))
+
+conf["model_path"] = config("MODEL_PATH", default="models/best.pt")
+# pytorch, onnx or openvino; see detection/inference/export.py for producing the files.
+conf["inference_backend"] = config("INFERENCE_BACKEND", default="pytorch")
+conf["onnx_model_path"] = config("ONNX_MODEL_PATH", default="models/best.onnx")
+conf["openvino_model_path"] = config("OPENVINO_MODEL_PATH", default="models/best_openvino_model")
+conf["inference_threads"] = int(config("INFERENCE_THREADS", default=0))
+conf["model_ready_timeout"] = float(config("MODEL_READY_TIMEOUT", default=30))
+conf["model_load_retry_seconds"] = float(config("MODEL_LOAD_RETRY_SECONDS", default=30))
+# Defaults to a hash of the weights file when empty.
+conf["model_version"] = config("MODEL_VERSION", default="")
+# host:port or a Unix socket path; empty runs the model inside each API worker.
+conf["model_server_address"] = config("MODEL_SERVER_ADDRESS", default="")
+# Shared secret for the model server connection; required whenever MODEL_SERVER_ADDRESS is set.
+# multiprocessing.connection unpickles what it receives, so anyone with the key can run code there.
+conf["model_server_authkey"] = config("MODEL_SERVER_AUTHKEY", default="")
+if conf["model_server_address"] and not conf["model_server_authkey"]:
+    logger.error("MODEL_SERVER_ADDRESS is set but MODEL_SERVER_AUTHKEY is empty. Exiting program.")
+    sys.exit(1)
+conf["model_server_workers"] = int(config("MODEL_SERVER_WORKERS", default=os.cpu_count() or 1))
+conf["model_server_timeout"] = float(config("MODEL_SERVER_TIMEOUT", default=30))
+conf["detect_imgsz"] = int(config("DETECT_IMGSZ", default=640))
+conf["detect_conf_threshold"] = float(config("DETECT_CONF_THRESHOLD", default=0.25))
+conf["detect_iou_threshold"] = float(config("DETECT_IOU_THRESHOLD", default=0.7))
+conf["detect_max_batch_size"] = int(config("DETECT_MAX_BATCH_SIZE", default=8))
+conf["detect_max_wait_ms"] = float(config("DETECT_MAX_WAIT_MS", default=10))
+conf["detect_max_queue_size"] = int(config("DETECT_MAX_QUEUE_SIZE", default=256))
+# Admission control: expected wait for the model before /detect runs at the smaller size or is refused.
+conf["detect_admission_enabled"] = config("DETECT_ADMISSION_ENABLED", default=True, cast=bool)
+conf["detect_degrade_wait_ms"] = float(config("DETECT_DEGRADE_WAIT_MS", default=1000))
+# Once degraded, /detect stays at DETECT_DEGRADE_IMGSZ until the expected wait is below this.
+conf["detect_recover_wait_ms"] = float(config("DETECT_RECOVER_WAIT_MS", default=500))
+conf["detect_reject_wait_ms"] = float(config("DETECT_REJECT_WAIT_MS", default=3000))
+conf["detect_degrade_imgsz"] = int(config("DETECT_DEGRADE_IMGSZ", default=480))
+# Images admitted at once across /detect and /detect/batch; more are answered with 429.
+conf["detect_max_in_flight"] = int(config("DETECT_MAX_IN_FLIGHT", default=128))
+conf["detect_batch_max_files"] = int(config("DETECT_BATCH_MAX_FILES", default=32))
+conf["detect_max_pixels"] = int(config("DETECT_MAX_PIXELS", default=50_000_000))
+conf["detect_early_downscale"] = config("DETECT_EARLY_DOWNSCALE", default=True, cast=bool)
+# Debug only: write uploads to temp/ and let Ultralytics read them from disk.
+conf["detect_save_uploads"] = config("DETECT_SAVE_UPLOADS", default=False, cast=bool)
+conf["detect_overlay_max_side"] = int(config("DETECT_OVERLAY_MAX_SIDE", default=1024))
+conf["detect_overlay_quality"] = int(config("DETECT_OVERLAY_QUALITY", default=85))
+# Overlays are cached with the prediction (in memory and in Mongo); larger JPEGs are re-rendered smaller.
+conf["detect_overlay_max_bytes"] = int(config("DETECT_OVERLAY_MAX_BYTES", default=200_000))
+# Test-time augmentation (mode=accurate, or mode=auto for borderline MEL/AKIEC results).
+conf["detect_tta_scales"] = [int(size) for size in config("DETECT_TTA_SCALES", default="640,832").split(",") if size.strip()]
+# h = horizontal, v = vertical; empty for multi-scale only.
+conf["detect_tta_flips"] = [flip.strip() for flip in config("DETECT_TTA_FLIPS", default="h").split(",") if flip.strip() in ("h", "v")]
+# Total time a detect request may take with TTA; otherwise the single-pass result is returned.
+conf["detect_tta_budget_ms"] = float(config("DETECT_TTA_BUDGET_MS", default=800))
+# Skip TTA outright while more images than this are waiting for the model.
+conf["detect_tta_max_queue_depth"] = int(config("DETECT_TTA_MAX_QUEUE_DEPTH", default=8))
+conf["detect_tta_iou_threshold"] = float(config("DETECT_TTA_IOU_THRESHOLD", default=0.55))
+# mode=auto re-checks high-risk predictions below this confidence.
+conf["detect_tta_borderline_conf"] = float(config("DETECT_TTA_BORDERLINE_CONF", default=0.7))
+
+conf["prediction_cache_max_entries"] = int(config("PREDICTION_CACHE_MAX_ENTRIES", default=1024))
+conf["prediction_cache_ttl_seconds"] = int(config("PREDICTION_CACHE_TTL_SECONDS", default=3600))
+conf["prediction_cache_mongo"] = config("PREDICTION_CACHE_MONGO", default=False, cast=bool)
+
+conf["report_max_image_bytes"] = int(config("REPORT_MAX_IMAGE_BYTES", default=15 * 1024 * 1024))
+conf["report_max_pdf_bytes"] = int(config("REPORT_MAX_PDF_BYTES", default=20 * 1024 * 1024))
+# GridFS chunk size; uploads are also read from the request in pieces of this size.
+conf["gridfs_chunk_bytes"] = int(config("GRIDFS_CHUNK_BYTES", default=255 * 1024))
+conf["report_thumbnail_px"] = int(config("REPORT_THUMBNAIL_PX", default=160))
+conf["report_preview_px"] = int(config("REPORT_PREVIEW_PX", default=640))
+conf["report_rendition_quality"] = int(config("REPORT_RENDITION_QUALITY", default=80))
 
 
 def get_config(name: str, default=None):
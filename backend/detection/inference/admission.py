@@ -0,0 +1,100 @@
+import math
+from typing import Optional
+
+from fastapi import HTTPException
+
+from detection.inference.batcher import BatchInferenceService
+from internal.utils.metrics import DETECT_ADMISSION_TOTAL
+
+
+class AdmissionController:
+    """
+    Decides, before any decoding or inference, whether a detection request
+    still fits.
+
+    Every admitted image counts as in flight until `release` is called;
+    callers admit only images the model will actually see, not cache hits.
+    The expected queue wait for a new image is the in-flight images ahead
+    of it, in batches, times the batch service's recent forward time.
+
+    Once that wait passes `degrade_wait_ms`, every new image runs at
+    `degrade_imgsz` so each batch gets cheaper, until the wait falls below
+    `recover_wait_ms`. Degradation is all-or-nothing on purpose: the batch
+    service only batches images of the same size, so mixing sizes while
+    overloaded would split the queue into smaller batches and lose more
+    throughput than the smaller size gains. Only the images already queued
+    when degradation starts or stops run in a batch of their own. The gap
+    between the two thresholds keeps it from flapping, since a batch gets
+    about (640 / 480)² = 1.8x dearer when leaving degradation.
+
+    Past `reject_wait_ms` the request is answered with 503, and once
+    `max_in_flight` images are in flight with 429, both with a Retry-After.
+    Requests that are admitted therefore never wait much more than
+    `reject_wait_ms` for the model.
+    """
+
+    def __init__(self, service: BatchInferenceService, degrade_wait_ms: float = 1000,
+                 reject_wait_ms: float = 3000, max_in_flight: int = 128, degrade_imgsz: Optional[int] = 480,
+                 recover_wait_ms: Optional[float] = None):
+        self.service = service
+        self.degrade_wait_ms = degrade_wait_ms
+        self.recover_wait_ms = degrade_wait_ms / 2 if recover_wait_ms is None else recover_wait_ms
+        self.reject_wait_ms = reject_wait_ms
+        self.max_in_flight = max_in_flight
+        self.degrade_imgsz = degrade_imgsz
+        self.in_flight = 0
+        self.degrading = False
+
+    def estimated_wait_ms(self, images: int = 1) -> float:
+        """Time until the last of `images` new images would reach the model."""
+        return self.service.estimate_wait_ms(self.in_flight + images - 1, batches=0)
+
+    def admit(self, imgsz: int, images: int = 1) -> int:
+        """Counts `images` as in flight and returns the input size to run them at, or raises 429/503."""
+        if self.in_flight + images > self.max_in_flight:
+            DETECT_ADMISSION_TOTAL.labels("rejected_in_flight").inc(images)
+            raise HTTPException(
+                status_code=429,
+                detail="Too many detection requests in progress, try again shortly",
+                headers={"Retry-After": str(self._retry_after(self.estimated_wait_ms(images)))},
+            )
+
+        wait_ms = self.estimated_wait_ms(images)
+        if wait_ms > self.reject_wait_ms:
+            DETECT_ADMISSION_TOTAL.labels("rejected_wait").inc(images)
+            raise HTTPException(
+                status_code=503,
+                detail="Detection is overloaded, try again shortly",
+                headers={"Retry-After": str(self._retry_after(wait_ms))},
+            )
+
+        self.in_flight += images
+        if self.degrade_imgsz and self.degrade_imgsz < imgsz:
+            if wait_ms > self.degrade_wait_ms:
+                self.degrading = True
+            elif wait_ms < self.recover_wait_ms:
+                self.degrading = False
+            if self.degrading:
+                DETECT_ADMISSION_TOTAL.labels("degraded").inc(images)
+                return self.degrade_imgsz
+        DETECT_ADMISSION_TOTAL.labels("admitted").inc(images)
+        return imgsz
+
+    def release(self, images: int = 1):
+        self.in_flight = max(0, self.in_flight - images)
+
+    @staticmethod
+    def _retry_after(wait_ms: float) -> int:
+        return max(1, math.ceil(wait_ms / 1000))
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "estimated_wait_ms": round(self.estimated_wait_ms(), 2),
+            "degrading": self.degrading,
+            "degrade_wait_ms": self.degrade_wait_ms,
+            "recover_wait_ms": self.recover_wait_ms,
+            "reject_wait_ms": self.reject_wait_ms,
+            "max_in_flight": self.max_in_flight,
+            "degrade_imgsz": self.degrade_imgsz,
+        }
@@ -0,0 +1,223 @@
+import ast
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from detection.inference.cache import file_fingerprint
+from internal.utils.metrics import observe_stage, stage_timer
+
+BACKENDS = ("pytorch", "onnx", "openvino")
+# Trained weights and where detection.inference.export writes each format.
+DEFAULT_MODEL_PATHS = {
+    "pytorch": "models/best.pt",
+    "onnx": "models/best.onnx",
+    "openvino": "models/best_openvino_model",
+}
+
+
+def weights_fingerprint(path: str) -> str:
+    """Fingerprint of a weights file, or of the `.bin` inside an OpenVINO export directory."""
+    if os.path.isdir(path):
+        weights = sorted(f for f in os.listdir(path) if f.endswith(".bin"))
+        if not weights:
+            raise FileNotFoundError(f"No .bin weights found in {path}")
+        return file_fingerprint(os.path.join(path, weights[0]))
+    return file_fingerprint(path)
+
+
+class UltralyticsBackend:
+    """
+    Model loaded through `ultralytics.YOLO`: PyTorch weights, or an OpenVINO
+    export directory.
+
+    `predict` returns one float32 array per image with rows of
+    `[x1, y1, x2, y2, conf, cls]` in input-image pixel coordinates.
+    """
+
+    name = "pytorch"
+
+    def __init__(self, model_path: str, name: Optional[str] = None, threads: int = 0,
+                 conf_threshold: float = 0.25, iou_threshold: float = 0.7):
+        from ultralytics import YOLO
+
+        if threads:
+            import torch
+
+            torch.set_num_threads(threads)
+
+        self.model_path = model_path
+        self.model = YOLO(model_path, task="detect")
+        self.names = self.model.names
+        self.version = weights_fingerprint(model_path)
+        self.threads = threads
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        if name:
+            self.name = name
+
+    def predict(self, images: list, imgsz: int = 640) -> List[np.ndarray]:
+        results = self.model(images, imgsz=imgsz, conf=self.conf_threshold, iou=self.iou_threshold, verbose=False)
+        if results:
+            # Ultralytics reports per-image milliseconds for the batch.
+            for stage, key in (("preprocess", "preprocess"), ("forward", "inference"), ("postprocess", "postprocess")):
+                observe_stage(stage, results[0].speed.get(key, 0.0) * len(results) / 1000)
+        return [r.boxes.data.cpu().numpy().astype(np.float32) for r in results]
+
+    def warmup(self, imgsz: int = 640):
+        self.predict([np.zeros((imgsz, imgsz, 3), dtype=np.uint8)], imgsz=imgsz)
+
+
+def letterbox(image: np.ndarray, size: int, color: int = 114):
+    """Resizes keeping aspect ratio and pads to `size`x`size`, like Ultralytics does."""
+    import cv2
+
+    h, w = image.shape[:2]
+    gain = min(size / h, size / w)
+    new_w, new_h = round(w * gain), round(h * gain)
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+    left, top = round(pad_x - 0.1), round(pad_y - 0.1)
+    out = np.full((size, size, 3), color, dtype=np.uint8)
+    out[top:top + new_h, left:left + new_w] = image
+    return out, gain, (left, top)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Greedy non-maximum suppression over `[x1, y1, x2, y2]` boxes; returns kept indices."""
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+class OnnxRuntimeBackend:
+    """
+    YOLO detection model exported to ONNX and run with ONNX Runtime on CPU,
+    without importing torch or ultralytics. Pre- and post-processing mirror
+    Ultralytics: square letterbox, then class-aware NMS.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path: str, threads: int = 0, conf_threshold: float = 0.25,
+                 iou_threshold: float = 0.7, max_det: int = 300):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+
+        self.model_path = model_path
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input = self.session.get_inputs()[0]
+        self.threads = threads
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.max_det = max_det
+        self.version = file_fingerprint(model_path)
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = {int(k): v for k, v in ast.literal_eval(metadata["names"]).items()}
+        batch, _, height, _ = self.input.shape
+        # Static exports have a fixed batch and image size baked in.
+        self.fixed_batch = batch if isinstance(batch, int) else None
+        self.fixed_imgsz = height if isinstance(height, int) else None
+
+    def preprocess(self, images: list, imgsz: int):
+        imgsz = self.fixed_imgsz or imgsz
+        batch, meta = [], []
+        for image in images:
+            padded, gain, pad = letterbox(image, imgsz)
+            batch.append(padded)
+            meta.append((gain, pad, image.shape[:2]))
+        # BGR HWC uint8 -> RGB CHW float32 in [0, 1]
+        tensor = np.stack(batch)[..., ::-1].transpose(0, 3, 1, 2)
+        return np.ascontiguousarray(tensor, dtype=np.float32) / 255.0, meta
+
+    def forward(self, tensor: np.ndarray) -> np.ndarray:
+        if self.fixed_batch is None:
+            return self.session.run(None, {self.input.name: tensor})[0]
+        outputs = [
+            self.session.run(None, {self.input.name: tensor[i:i + self.fixed_batch]})[0]
+            for i in range(0, len(tensor), self.fixed_batch)
+        ]
+        return np.concatenate(outputs)
+
+    def postprocess(self, output: np.ndarray, meta: list) -> List[np.ndarray]:
+        results = []
+        # (batch, 4 + classes, anchors) -> (batch, anchors, 4 + classes)
+        for pred, (gain, (left, top), (h, w)) in zip(output.transpose(0, 2, 1), meta):
+            class_scores = pred[:, 4:]
+            cls = class_scores.argmax(axis=1)
+            scores = class_scores[np.arange(len(cls)), cls]
+            mask = scores > self.conf_threshold
+            xywh, scores, cls = pred[mask, :4], scores[mask], cls[mask]
+
+            boxes = np.empty_like(xywh)
+            boxes[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+            boxes[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+
+            # Offsetting boxes per class makes one NMS pass class-aware.
+            keep = nms(boxes + cls[:, None] * 7680.0, scores, self.iou_threshold)[:self.max_det]
+            boxes, scores, cls = boxes[keep], scores[keep], cls[keep]
+
+            boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - left) / gain).clip(0, w)
+            boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - top) / gain).clip(0, h)
+            results.append(np.column_stack([boxes, scores, cls]).astype(np.float32))
+        return results
+
+    def predict(self, images: list, imgsz: int = 640) -> List[np.ndarray]:
+        with stage_timer("preprocess"):
+            tensor, meta = self.preprocess(images, imgsz)
+        with stage_timer("forward"):
+            output = self.forward(tensor)
+        with stage_timer("postprocess"):
+            return self.postprocess(output, meta)
+
+    def warmup(self, imgsz: int = 640):
+        self.predict([np.zeros((imgsz, imgsz, 3), dtype=np.uint8)], imgsz=imgsz)
+
+
+def build_backend(kind: str, model_path: str, threads: int = 0, conf_threshold: float = 0.25,
+                  iou_threshold: float = 0.7):
+    """Builds a backend from explicit settings, without the app config (and its `.env`)."""
+    if kind in ("pytorch", "openvino"):
+        return UltralyticsBackend(model_path, name=kind, threads=threads, conf_threshold=conf_threshold,
+                                  iou_threshold=iou_threshold)
+    if kind == "onnx":
+        return OnnxRuntimeBackend(model_path, threads=threads, conf_threshold=conf_threshold,
+                                  iou_threshold=iou_threshold)
+    raise ValueError(f"Unknown inference backend {kind!r}, expected one of {BACKENDS}")
+
+
+def load_backend(kind: Optional[str] = None, model_path: Optional[str] = None):
+    """Builds the inference backend selected by INFERENCE_BACKEND (or `kind`)."""
+    from config.config import conf
+
+    kind = kind or conf["inference_backend"]
+    default_paths = {
+        "pytorch": conf["model_path"],
+        "onnx": conf["onnx_model_path"],
+        "openvino": conf["openvino_model_path"],
+    }
+    return build_backend(
+        kind,
+        model_path or default_paths.get(kind),
+        threads=conf["inference_threads"],
+        conf_threshold=conf["detect_conf_threshold"],
+        iou_threshold=conf["detect_iou_threshold"],
+    )
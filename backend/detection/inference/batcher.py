@@ -0,0 +1,215 @@
+import asyncio
+import math
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, List, Optional
+
+from internal.utils.logger import logger
+
+
+class _Job:
+    __slots__ = ("image", "options", "key", "future", "enqueued_at")
+
+    def __init__(self, image: Any, options: dict, future: asyncio.Future):
+        self.image = image
+        self.options = options
+        self.key = tuple(sorted(options.items()))
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class BatchInferenceService:
+    """
+    Queues incoming images and runs them through the model in batches.
+
+    A batch is closed once it reaches `max_batch_size` images or once the
+    first image in it has waited `max_wait_ms`. Each batch is one forward
+    pass on a dedicated worker thread, so the event loop is never blocked.
+    Jobs submitted with different options (e.g. `imgsz`) never share a batch.
+    """
+
+    def __init__(
+        self,
+        predict_fn: Callable[..., List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        max_queue_size: int = 256,
+    ):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_queue_size = max_queue_size
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: Deque[_Job] = deque()
+        self._worker: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+
+        self._requests_total = 0
+        self._batches_total = 0
+        self._batch_sizes: Counter = Counter()
+        self._queue_wait_ms_total = 0.0
+        self._forward_ms_total = 0.0
+        self._last_batch_size = 0
+        self._last_forward_ms = 0.0
+        # Exponentially weighted, so estimates follow the current load and input sizes.
+        self._recent_forward_ms: Optional[float] = None
+        self._running_batch = 0
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._worker = asyncio.create_task(self._run(), name="batch-inference")
+        logger.info(
+            f"Batch inference started (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait * 1000:g})"
+        )
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        while self._pending:
+            self._fail(self._pending.popleft(), RuntimeError("Inference service stopped"))
+        while self._queue is not None and not self._queue.empty():
+            self._fail(self._queue.get_nowait(), RuntimeError("Inference service stopped"))
+
+    async def submit(self, image: Any, **options) -> Any:
+        """Enqueues one image and waits for its own slice of the batch result."""
+        if not self.running:
+            await self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Job(image, options, future))
+        self._requests_total += 1
+        return await future
+
+    def queue_depth(self) -> int:
+        return (self._queue.qsize() if self._queue is not None else 0) + len(self._pending)
+
+    def estimate_ms(self, batches: float = 1.0) -> float:
+        """
+        Rough time until `batches` more batches submitted now have run: the
+        queue ahead of them plus their own forward passes, at the recent
+        forward time. 0 until the first batch has run.
+        """
+        return self.estimate_wait_ms(self.queue_depth() + self._running_batch, batches)
+
+    def estimate_wait_ms(self, images_ahead: int, batches: float = 1.0) -> float:
+        """Like `estimate_ms`, with the images queued or running ahead given by the caller."""
+        if self._recent_forward_ms is None:
+            return 0.0
+        return (math.ceil(images_ahead / self.max_batch_size) + batches) * self._recent_forward_ms
+
+    def stats(self) -> dict:
+        batches = self._batches_total
+        return {
+            "queue_depth": self.queue_depth(),
+            "running_batch_size": self._running_batch,
+            "requests_total": self._requests_total,
+            "batches_total": batches,
+            "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+            "avg_batch_size": round(sum(k * v for k, v in self._batch_sizes.items()) / batches, 2) if batches else 0.0,
+            "last_batch_size": self._last_batch_size,
+            "avg_queue_wait_ms": round(self._queue_wait_ms_total / max(self._requests_total, 1), 2),
+            "avg_forward_ms": round(self._forward_ms_total / batches, 2) if batches else 0.0,
+            "last_forward_ms": round(self._last_forward_ms, 2),
+            "recent_forward_ms": round(self._recent_forward_ms or 0.0, 2),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+    async def _next_job(self, timeout: Optional[float] = None) -> Optional[_Job]:
+        if self._pending:
+            return self._pending.popleft()
+        if timeout is None:
+            return await self._queue.get()
+        if timeout <= 0:
+            return self._queue.get_nowait() if not self._queue.empty() else None
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def _collect_batch(self) -> List[_Job]:
+        loop = asyncio.get_running_loop()
+        first = await self._next_job()
+        batch = [first]
+        deadline = loop.time() + self.max_wait
+        deferred = []
+
+        while len(batch) < self.max_batch_size:
+            job = await self._next_job(deadline - loop.time())
+            if job is None:
+                break
+            if job.key == first.key:
+                batch.append(job)
+            else:
+                deferred.append(job)
+
+        # Jobs with other options go first in line for the next batch.
+        self._pending.extendleft(reversed(deferred))
+        return [job for job in batch if not job.future.done()]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            for job in batch:
+                self._queue_wait_ms_total += (started - job.enqueued_at) * 1000
+
+            self._running_batch = len(batch)
+            try:
+                results = await loop.run_in_executor(
+                    self._executor,
+                    lambda: self.predict_fn([job.image for job in batch], **batch[0].options),
+                )
+                if len(results) != len(batch):
+                    raise RuntimeError(f"Model returned {len(results)} results for a batch of {len(batch)}")
+            except asyncio.CancelledError:
+                for job in batch:
+                    self._fail(job, RuntimeError("Inference service stopped"))
+                raise
+            except Exception as exc:
+                logger.exception(f"Batch inference failed for {len(batch)} image(s)")
+                for job in batch:
+                    self._fail(job, exc)
+                continue
+            finally:
+                self._running_batch = 0
+
+            forward_ms = (time.perf_counter() - started) * 1000
+            self._batches_total += 1
+            self._batch_sizes[len(batch)] += 1
+            self._last_batch_size = len(batch)
+            self._last_forward_ms = forward_ms
+            self._forward_ms_total += forward_ms
+            if self._recent_forward_ms is None:
+                self._recent_forward_ms = forward_ms
+            else:
+                self._recent_forward_ms += 0.2 * (forward_ms - self._recent_forward_ms)
+
+            for job, result in zip(batch, results):
+                if not job.future.done():
+                    job.future.set_result(result)
+
+    @staticmethod
+    def _fail(job: _Job, exc: BaseException):
+        if not job.future.done():
+            job.future.set_exception(exc)
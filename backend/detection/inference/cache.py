@@ -0,0 +1,198 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from pymongo.errors import PyMongoError
+
+from internal.utils.logger import logger
+
+
+# Bump when the shape of cached results changes so stale shared entries are ignored.
+RESULT_FORMAT = 2
+
+
+def image_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_cache_key(digest: str, model_version: str, imgsz: int) -> str:
+    """`digest` is the `image_digest` of the upload; hash it once per request."""
+    return f"{digest}:{model_version}:{imgsz}:v{RESULT_FORMAT}"
+
+
+def file_fingerprint(path: str) -> str:
+    """Short content hash of a weights file, used as the model version."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+class PredictionCache:
+    """
+    Two-tier cache for prediction results keyed by `make_cache_key`.
+
+    The first tier is an in-process LRU bounded by `max_entries` and
+    `ttl_seconds`. The optional second tier is a MongoDB collection shared by
+    all workers; its documents expire through a TTL index on `expires_at`.
+    Concurrent misses for the same key share a single computation.
+    Cached values must be BSON-serialisable when the shared tier is used.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, collection=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.collection = collection
+
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: dict = {}
+        self._hits = {"memory": 0, "mongo": 0, "coalesced": 0}
+        self._misses = 0
+
+    async def ensure_indexes(self):
+        if self.collection is None:
+            return
+        try:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+        except PyMongoError as exc:
+            logger.warning(f"Could not create prediction cache TTL index: {exc}")
+
+    def _get_local(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_local(self, key: str, value: Any):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _get_shared(self, key: str) -> Optional[Any]:
+        if self.collection is None:
+            return None
+        try:
+            doc = await self.collection.find_one(
+                {"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+                {"value": 1},
+            )
+        except PyMongoError as exc:
+            logger.warning(f"Prediction cache lookup failed: {exc}")
+            return None
+        return doc["value"] if doc else None
+
+    async def _set_shared(self, key: str, value: Any):
+        if self.collection is None:
+            return
+        try:
+            await self.collection.replace_one(
+                {"_id": key},
+                {
+                    "value": value,
+                    "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds),
+                },
+                upsert=True,
+            )
+        except PyMongoError as exc:
+            logger.warning(f"Prediction cache write failed: {exc}")
+
+    async def get(self, key: str) -> Tuple[Optional[Any], Optional[str]]:
+        """Returns `(value, tier)`; `tier` is None on a miss."""
+        value, tier = await self.peek(key)
+        if tier is not None:
+            self._hits[tier] += 1
+        return value, tier
+
+    async def peek(self, key: str) -> Tuple[Optional[Any], Optional[str]]:
+        """Like `get`, without counting towards the hit ratio; for looking ahead at a key."""
+        value = self._get_local(key)
+        if value is not None:
+            return value, "memory"
+
+        value = await self._get_shared(key)
+        if value is not None:
+            self._set_local(key, value)
+            return value, "mongo"
+
+        return None, None
+
+    async def set(self, key: str, value: Any):
+        self._set_local(key, value)
+        await self._set_shared(key, value)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]],
+                             lookup: Optional[Tuple[Optional[Any], Optional[str]]] = None) -> Tuple[Any, bool]:
+        """
+        Returns `(value, hit)`, running `compute` at most once per key at a
+        time. Callers that joined a computation whose owner got cancelled run
+        `compute` themselves instead of being cancelled along with it.
+        `lookup` is the result of an earlier `peek(key)` by the same caller,
+        used instead of looking the key up again; after a miss only the
+        in-process tier is rechecked, which is free, not the shared one.
+        """
+        if lookup is None:
+            value, tier = await self.get(key)
+        else:
+            value, tier = lookup
+            if tier is None:
+                value = self._get_local(key)
+                tier = "memory" if value is not None else None
+            if tier is not None:
+                self._hits[tier] += 1
+        if tier is not None:
+            return value, True
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            try:
+                value = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling() or not pending.cancelled():
+                    raise
+                return await self.get_or_compute(key, compute)
+            self._hits["coalesced"] += 1
+            return value, True
+
+        self._misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+            await self.set(key, value)
+            future.set_result(value)
+            return value, False
+        except Exception as exc:
+            future.set_exception(exc)
+            # Nobody else may be waiting; retrieve it so asyncio doesn't warn.
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        hits = sum(self._hits.values())
+        lookups = hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "shared_tier": self.collection is not None,
+            "hits": dict(self._hits),
+            "misses": self._misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
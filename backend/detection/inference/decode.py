@@ -0,0 +1,54 @@
+import io
+from typing import Optional
+
+import numpy as np
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+class ImageDecodeError(ValueError):
+    pass
+
+
+class ImageTooLargeError(ImageDecodeError):
+    pass
+
+
+def decode_image(data: bytes, max_pixels: int, target_size: Optional[int] = None) -> np.ndarray:
+    """
+    Decodes uploaded image bytes into a BGR uint8 array, the layout Ultralytics
+    expects for in-memory sources.
+
+    The pixel cap is checked against the header before any pixel data is
+    decoded. When `target_size` is given, JPEGs are decoded at a reduced DCT
+    scale and the result is shrunk so its longest side is at most
+    `target_size`; the model letterboxes to that size anyway.
+    """
+    if not data:
+        raise ImageDecodeError("Empty image upload")
+
+    try:
+        img = Image.open(io.BytesIO(data))
+    except Image.DecompressionBombError as exc:
+        raise ImageTooLargeError(str(exc)) from exc
+    except (UnidentifiedImageError, OSError) as exc:
+        raise ImageDecodeError("Unsupported or corrupt image") from exc
+
+    width, height = img.size
+    if width * height > max_pixels:
+        raise ImageTooLargeError(
+            f"Image is {width}x{height} ({width * height} pixels), the limit is {max_pixels} pixels"
+        )
+
+    try:
+        if target_size:
+            img.draft("RGB", (target_size, target_size))
+        # cv2.imread honours EXIF orientation, so the file-based path did too.
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("RGB")
+        if target_size:
+            img.thumbnail((target_size, target_size), Image.Resampling.BILINEAR)
+        rgb = np.asarray(img)
+    except OSError as exc:
+        raise ImageDecodeError("Unsupported or corrupt image") from exc
+
+    return np.ascontiguousarray(rgb[:, :, ::-1])
@@ -0,0 +1,117 @@
+"""
+Exports the trained PyTorch weights for the CPU inference backends.
+
+    python -m detection.inference.export --format onnx
+    python -m detection.inference.export --format onnx --int8 --calibration-images 200
+    python -m detection.inference.export --format openvino
+
+The INT8 ONNX variant is statically quantized with ONNX Runtime, calibrated
+on lesion images from `detection/data/images`. Run
+`python -m detection.inference.parity` before switching INFERENCE_BACKEND.
+"""
+
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+
+from detection.inference.backends import DEFAULT_MODEL_PATHS, letterbox
+from internal.utils.logger import logger
+
+
+def export_onnx(weights: str, imgsz: int) -> str:
+    from ultralytics import YOLO
+
+    # Dynamic axes let the batcher feed whatever batch size it collected.
+    return YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+
+
+def export_openvino(weights: str, imgsz: int) -> str:
+    from ultralytics import YOLO
+
+    return YOLO(weights).export(format="openvino", imgsz=imgsz, dynamic=True)
+
+
+class _LesionCalibrationReader:
+    def __init__(self, input_name: str, image_paths: list, imgsz: int):
+        self.input_name = input_name
+        self.image_paths = iter(image_paths)
+        self.imgsz = imgsz
+
+    def get_next(self):
+        import cv2
+
+        for path in self.image_paths:
+            image = cv2.imread(str(path))
+            if image is None:
+                continue
+            padded, _, _ = letterbox(image, self.imgsz)
+            tensor = padded[None, ..., ::-1].transpose(0, 3, 1, 2)
+            return {self.input_name: np.ascontiguousarray(tensor, dtype=np.float32) / 255.0}
+        return None
+
+
+def quantize_int8(onnx_path: str, images_dir: str, count: int, imgsz: int) -> str:
+    import onnxruntime as ort
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    image_paths = sorted(Path(images_dir).glob("*.jpg"))[:count]
+    if not image_paths:
+        raise FileNotFoundError(f"No calibration images (*.jpg) found in {images_dir}")
+
+    base, _ = os.path.splitext(onnx_path)
+    prepared_path = f"{base}.prep.onnx"
+    output_path = f"{base}.int8.onnx"
+
+    quant_pre_process(onnx_path, prepared_path)
+    input_name = ort.InferenceSession(prepared_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    quantize_static(
+        prepared_path,
+        output_path,
+        _LesionCalibrationReader(input_name, image_paths, imgsz),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+    os.remove(prepared_path)
+
+    # The backend reads class names from the model metadata, which the
+    # quantizer does not carry over.
+    import onnx
+
+    source = onnx.load(onnx_path, load_external_data=False)
+    quantized = onnx.load(output_path)
+    onnx.helper.set_model_props(quantized, {p.key: p.value for p in source.metadata_props})
+    onnx.save(quantized, output_path)
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the detection model for CPU inference backends.")
+    parser.add_argument("--format", choices=("onnx", "openvino"), default="onnx")
+    parser.add_argument("--weights", default=DEFAULT_MODEL_PATHS["pytorch"])
+    parser.add_argument("--imgsz", type=int, default=640, help="Same as DETECT_IMGSZ in production")
+    parser.add_argument("--int8", action="store_true", help="Also write a statically quantized INT8 ONNX model")
+    parser.add_argument("--images-dir", default="detection/data/images")
+    parser.add_argument("--calibration-images", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.format == "openvino":
+        path = export_openvino(args.weights, args.imgsz)
+        logger.info(f"OpenVINO model written to {path}")
+        return
+
+    path = export_onnx(args.weights, args.imgsz)
+    logger.info(f"ONNX model written to {path}")
+
+    if args.int8:
+        int8_path = quantize_int8(path, args.images_dir, args.calibration_images, args.imgsz)
+        logger.info(f"INT8 ONNX model written to {int8_path}")
+
+
+if __name__ == "__main__":
+    main()
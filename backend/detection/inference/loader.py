@@ -0,0 +1,92 @@
+import asyncio
+import time
+from typing import Any, Callable, Optional
+
+from internal.utils.logger import logger
+
+
+class ModelNotReadyError(Exception):
+    pass
+
+
+class ModelLoader:
+    """
+    Loads the inference backend on a worker thread after startup so the rest
+    of the API can serve immediately. Requests that need the model wait on a
+    readiness gate; a failed load is retried every `retry_seconds`.
+    """
+
+    def __init__(self, factory: Callable[[], Any], retry_seconds: float = 30.0):
+        self.factory = factory
+        self.retry_seconds = retry_seconds
+        self.model: Optional[Any] = None
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.attempts = 0
+        self.load_seconds: Optional[float] = None
+
+        self._ready: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._ready = asyncio.Event()
+        self._task = asyncio.create_task(self._load(), name="model-loader")
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _load(self):
+        while True:
+            self.state = "loading"
+            self.attempts += 1
+            started = time.perf_counter()
+            try:
+                self.model = await asyncio.to_thread(self.factory)
+            except Exception as exc:
+                self.state = "failed"
+                self.error = f"{type(exc).__name__}: {exc}"
+                logger.exception(f"Model load attempt {self.attempts} failed")
+                if self.retry_seconds <= 0:
+                    return
+                await asyncio.sleep(self.retry_seconds)
+                continue
+
+            self.load_seconds = time.perf_counter() - started
+            self.state = "ready"
+            self.error = None
+            self._ready.set()
+            logger.info(f"Model ({self.model.name}) loaded in {self.load_seconds:.2f}s")
+            return
+
+    async def wait_ready(self, timeout: float) -> Any:
+        if self.ready:
+            return self.model
+        if self._ready is None:
+            raise ModelNotReadyError("Model loading has not started")
+        if self.state == "failed" and self.retry_seconds <= 0:
+            raise ModelNotReadyError(f"Model failed to load: {self.error}")
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            raise ModelNotReadyError(f"Model is still {self.state}") from None
+        return self.model
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "backend": getattr(self.model, "name", None),
+            "attempts": self.attempts,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "error": self.error,
+        }
@@ -0,0 +1,379 @@
+"""
+Standalone model server shared by every API worker on a host.
+
+One server process owns a pool of inference worker processes, each holding a
+single copy of the model. API workers talk to it over a local
+`multiprocessing.connection` socket, but image pixels and output boxes never
+go through pickle: the client writes the batch into a POSIX shared-memory
+block and the worker writes its boxes into another one. Only block names and
+shapes cross the socket, so API workers and the server must share `/dev/shm`
+(same host, or containers with a shared IPC namespace).
+
+Run it from the backend directory:
+
+    MODEL_SERVER_AUTHKEY=<secret> python -m detection.inference.model_server --workers 4
+
+and point the API at it with MODEL_SERVER_ADDRESS and the same
+MODEL_SERVER_AUTHKEY. Neither side starts without the key.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context, resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Optional
+
+import numpy as np
+
+from config.config import conf
+from detection.inference.backends import BACKENDS, load_backend
+from internal.utils.logger import logger
+from internal.utils.metrics import capture_stages, observe_stage
+
+BOX_COLUMNS = 6
+
+_backend = None
+
+
+def parse_address(address: str):
+    """`host:port` becomes a TCP address, anything else a Unix socket path."""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return host or "127.0.0.1", int(port)
+    return address
+
+
+def _attach(name: str) -> SharedMemory:
+    # Blocks are owned (and unlinked) by whoever created them, so keep this
+    # process's resource tracker from unlinking them again at exit.
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+    shm = SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def _create(size: int, track: bool = True) -> SharedMemory:
+    if track or sys.version_info < (3, 13):
+        shm = SharedMemory(create=True, size=max(size, 1))
+        if not track:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+    return SharedMemory(create=True, size=max(size, 1), track=False)
+
+
+# --- worker process side ---------------------------------------------------
+
+def _init_worker(backend: str, model_path: Optional[str], threads: int):
+    global _backend
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+    conf["inference_threads"] = conf["inference_threads"] or threads
+    _backend = load_backend(backend, model_path)
+
+
+def _worker_info(imgsz: int) -> dict:
+    _backend.warmup(imgsz)
+    return {"pid": os.getpid(), "names": dict(_backend.names), "version": _backend.version}
+
+
+def _worker_ping() -> int:
+    return os.getpid()
+
+
+def _image_views(buf, shapes: List[tuple]) -> List[np.ndarray]:
+    views, offset = [], 0
+    for shape in shapes:
+        views.append(np.ndarray(shape, dtype=np.uint8, buffer=buf, offset=offset))
+        offset += views[-1].nbytes
+    return views
+
+
+def _worker_predict(shm_name: str, shapes: List[tuple], imgsz: int):
+    shm = _attach(shm_name)
+    try:
+        images = _image_views(shm.buf, shapes)
+        # This process is never scraped; the timings travel back with the boxes.
+        with capture_stages() as stages:
+            boxes = _backend.predict(images, imgsz=imgsz)
+        # The views must be gone before the block can be closed.
+        del images
+    finally:
+        shm.close()
+
+    counts = [len(b) for b in boxes]
+    out = _create(sum(counts) * BOX_COLUMNS * 4, track=False)
+    try:
+        if sum(counts):
+            view = np.ndarray((sum(counts), BOX_COLUMNS), dtype=np.float32, buffer=out.buf)
+            view[:] = np.concatenate([b.reshape(-1, BOX_COLUMNS) for b in boxes])
+            del view
+        return out.name, counts, stages
+    finally:
+        out.close()
+
+
+def require_authkey(authkey: bytes):
+    """
+    Connections unpickle what they receive, so the key is all that stands
+    between the port and arbitrary code execution; never run without one.
+    """
+    if not authkey:
+        raise ValueError("The model server needs an authkey; set MODEL_SERVER_AUTHKEY to a long random secret")
+
+
+# --- server side -----------------------------------------------------------
+
+class ModelServer:
+    def __init__(self, address, authkey: bytes, backend: str, model_path: Optional[str], workers: int,
+                 imgsz: int = 640, health_interval: float = 10.0, ready_timeout: float = 300.0):
+        require_authkey(authkey)
+        self.address = address
+        self.authkey = authkey
+        self.backend = backend
+        self.model_path = model_path
+        self.workers = max(1, workers)
+        self.imgsz = imgsz
+        self.health_interval = health_interval
+        self.ready_timeout = ready_timeout
+        self.threads_per_worker = max(1, (os.cpu_count() or 1) // self.workers)
+
+        self.info: Optional[dict] = None
+        self.restarts = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _spawn_pool(self):
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.backend, self.model_path, self.threads_per_worker),
+        )
+        # One warm-up per worker: spawns the whole pool, loads the model in
+        # each process and fails loudly if any of them cannot serve.
+        futures = [executor.submit(_worker_info, self.imgsz) for _ in range(self.workers)]
+        infos = [f.result(timeout=self.ready_timeout) for f in futures]
+        self.info = infos[0]
+        logger.info(f"Model server pool ready: {self.workers} worker(s), pids={[i['pid'] for i in infos]}")
+        return executor
+
+    def _restart_pool(self, broken: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is not broken:
+                return
+            logger.warning("Inference worker crashed, restarting the process pool")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._spawn_pool()
+            self.restarts += 1
+
+    def _submit(self, fn, *args, timeout: Optional[float] = None):
+        for attempt in range(2):
+            executor = self._executor
+            try:
+                return executor.submit(fn, *args).result(timeout=timeout)
+            except BrokenProcessPool:
+                self._restart_pool(executor)
+                if attempt:
+                    raise
+
+    def _watchdog(self):
+        while True:
+            time.sleep(self.health_interval)
+            try:
+                self._submit(_worker_ping, timeout=self.ready_timeout)
+            except Exception:
+                logger.exception("Model server health check failed")
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+
+                try:
+                    if request["op"] == "ping":
+                        response = {
+                            "ok": True,
+                            "backend": self.backend,
+                            "workers": self.workers,
+                            "restarts": self.restarts,
+                            **self.info,
+                        }
+                    elif request["op"] == "predict":
+                        out_name, counts, stages = self._submit(
+                            _worker_predict, request["shm"], request["shapes"], request["imgsz"]
+                        )
+                        response = {"ok": True, "shm": out_name, "counts": counts, "stages": stages}
+                    else:
+                        response = {"ok": False, "error": f"Unknown op {request['op']!r}"}
+                except Exception as exc:
+                    logger.exception("Model server request failed")
+                    response = {"ok": False, "error": f"{type(exc).__name__}: {exc}"}
+
+                try:
+                    conn.send(response)
+                except (EOFError, OSError):
+                    if response.get("shm"):
+                        SharedMemory(name=response["shm"]).unlink()
+                    return
+
+    def serve_forever(self):
+        self._executor = self._spawn_pool()
+        threading.Thread(target=self._watchdog, name="model-server-watchdog", daemon=True).start()
+
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+        with Listener(self.address, authkey=self.authkey) as listener:
+            logger.info(f"Model server listening on {self.address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception:
+                    logger.exception("Model server rejected a connection")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+
+# --- API worker side -------------------------------------------------------
+
+class ModelServerClient:
+    """
+    Drop-in replacement for an in-process backend that forwards batches to a
+    `ModelServer`. Safe to share between threads; requests are serialised
+    over one connection per client.
+    """
+
+    name = "model-server"
+
+    def __init__(self, address: str, authkey: bytes, timeout: float = 30.0):
+        require_authkey(authkey)
+        self.address = parse_address(address)
+        self.authkey = authkey
+        self.timeout = timeout
+        self.names: Optional[dict] = None
+        self.version: Optional[str] = None
+
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _request(self, message: dict) -> dict:
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._conn is None:
+                        self._conn = Client(self.address, authkey=self.authkey)
+                    self._conn.send(message)
+                    if not self._conn.poll(self.timeout):
+                        raise TimeoutError(f"Model server did not answer within {self.timeout}s")
+                    response = self._conn.recv()
+                    break
+                except (EOFError, OSError) as exc:
+                    self._close()
+                    # TimeoutError is an OSError too, but retrying it could
+                    # run the batch twice.
+                    if attempt or isinstance(exc, TimeoutError):
+                        raise ConnectionError(f"Model server unavailable: {exc}") from exc
+
+        if not response.get("ok"):
+            raise RuntimeError(f"Model server error: {response.get('error')}")
+        return response
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except OSError:
+                pass
+            self._conn = None
+
+    def ping(self) -> dict:
+        info = self._request({"op": "ping"})
+        self.names = {int(k): v for k, v in info["names"].items()}
+        self.version = info["version"]
+        return info
+
+    def wait_until_ready(self, timeout: float = 60.0) -> dict:
+        """Startup health check: blocks until the server answers a ping."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self.ping()
+            except (ConnectionError, RuntimeError) as exc:
+                if time.monotonic() >= deadline:
+                    raise RuntimeError(f"Model server at {self.address} not ready: {exc}") from exc
+                time.sleep(0.5)
+
+    def predict(self, images: list, imgsz: int = 640) -> List[np.ndarray]:
+        arrays = [np.ascontiguousarray(image, dtype=np.uint8) for image in images]
+        shm = _create(sum(a.nbytes for a in arrays))
+        try:
+            for view, a in zip(_image_views(shm.buf, [a.shape for a in arrays]), arrays):
+                view[:] = a
+
+            response = self._request({
+                "op": "predict",
+                "shm": shm.name,
+                "shapes": [a.shape for a in arrays],
+                "imgsz": imgsz,
+            })
+        finally:
+            shm.close()
+            shm.unlink()
+
+        out = SharedMemory(name=response["shm"])
+        try:
+            total = sum(response["counts"])
+            flat = np.ndarray((total, BOX_COLUMNS), dtype=np.float32, buffer=out.buf).copy()
+        finally:
+            out.close()
+            out.unlink()
+
+        for stage, seconds in response.get("stages", ()):
+            observe_stage(stage, seconds)
+
+        bounds = np.cumsum([0] + response["counts"])
+        return [flat[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the detection model to all API workers on this host.")
+    parser.add_argument("--address", default=conf["model_server_address"] or "127.0.0.1:8765")
+    parser.add_argument("--workers", type=int, default=conf["model_server_workers"])
+    parser.add_argument("--backend", default=conf["inference_backend"], choices=BACKENDS)
+    parser.add_argument("--model", default=None, help="Weights path; defaults to the one configured for the backend")
+    parser.add_argument("--imgsz", type=int, default=conf["detect_imgsz"])
+    args = parser.parse_args()
+    if not conf["model_server_authkey"]:
+        parser.error("MODEL_SERVER_AUTHKEY must be set to a shared secret")
+
+    server = ModelServer(
+        parse_address(args.address),
+        authkey=conf["model_server_authkey"].encode(),
+        backend=args.backend,
+        model_path=args.model,
+        workers=args.workers,
+        imgsz=args.imgsz,
+    )
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
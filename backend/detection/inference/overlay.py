@@ -0,0 +1,79 @@
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+from detection.processing.constants import CLASS_COLORS
+
+_COLORS = np.asarray(CLASS_COLORS, dtype=np.uint8)
+# Overlays are never shrunk below this to meet a byte budget.
+MIN_OVERLAY_SIDE = 256
+
+
+def normalized_boxes(boxes: np.ndarray, width: int, height: int) -> np.ndarray:
+    """`[x1, y1, x2, y2, ...]` pixel rows -> `[x1, y1, x2, y2]` in 0..1 of the image size."""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 6)
+    scale = np.array([width, height, width, height], dtype=np.float64)
+    return np.clip(boxes[:, :4] / scale, 0.0, 1.0)
+
+
+def draw_boxes(image: np.ndarray, boxes: np.ndarray, class_names: Dict[int, str]) -> np.ndarray:
+    """
+    Draws `[x1, y1, x2, y2, conf, cls]` rows onto a copy of a BGR image using
+    CLASS_COLORS. Coordinates, colours and label positions are computed for
+    all boxes at once; only the OpenCV draw calls run per box.
+    """
+    canvas = image.copy()
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 6)
+    if not len(boxes):
+        return canvas
+
+    height, width = canvas.shape[:2]
+    thickness = max(1, round(max(height, width) / 320))
+    font_scale = thickness / 3
+
+    xyxy = np.rint(boxes[:, :4]).astype(np.int32)
+    xyxy[:, [0, 2]] = np.clip(xyxy[:, [0, 2]], 0, width - 1)
+    xyxy[:, [1, 3]] = np.clip(xyxy[:, [1, 3]], 0, height - 1)
+    class_ids = boxes[:, 5].astype(np.int32)
+    colors = _COLORS[class_ids % len(_COLORS)].tolist()
+    # Labels go above the box, or inside it when the box touches the top edge.
+    label_y = np.where(xyxy[:, 1] > 12 * thickness, xyxy[:, 1] - 4 * thickness, xyxy[:, 1] + 12 * thickness)
+
+    for (x1, y1, x2, y2), y, color, cls_id, score in zip(xyxy.tolist(), label_y.tolist(), colors, class_ids, boxes[:, 4]):
+        cv2.rectangle(canvas, (x1, y1), (x2, y2), color, thickness)
+        label = f"{class_names.get(int(cls_id), cls_id)} {score:.2f}"
+        cv2.putText(canvas, label, (x1, y), cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, thickness, cv2.LINE_AA)
+    return canvas
+
+
+def render_overlay(image: np.ndarray, boxes: np.ndarray, class_names: Dict[int, str],
+                   max_side: Optional[int] = None, quality: int = 85, max_bytes: Optional[int] = None) -> bytes:
+    """
+    Draws the boxes and encodes the result as JPEG, shrinking it first so its
+    longest side is at most `max_side`. With `max_bytes`, a JPEG that comes
+    out larger is re-rendered at smaller sizes until it fits (or reaches
+    MIN_OVERLAY_SIDE), so cached overlays have a bounded size.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 6)
+    height, width = image.shape[:2]
+    side = min(max_side or max(height, width), max(height, width))
+    while True:
+        jpeg = _render(image, boxes, class_names, side, quality)
+        if not max_bytes or len(jpeg) <= max_bytes or side <= MIN_OVERLAY_SIDE:
+            return jpeg
+        side = max(MIN_OVERLAY_SIDE, int(side * 0.75))
+
+
+def _render(image: np.ndarray, boxes: np.ndarray, class_names: Dict[int, str], max_side: int, quality: int) -> bytes:
+    height, width = image.shape[:2]
+    if max(height, width) > max_side:
+        scale = max_side / max(height, width)
+        image = cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+        boxes = boxes.copy()
+        boxes[:, :4] *= scale
+
+    ok, encoded = cv2.imencode(".jpg", draw_boxes(image, boxes, class_names), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Could not encode overlay")
+    return encoded.tobytes()
@@ -0,0 +1,122 @@
+"""
+Accuracy-parity check between the PyTorch model and a CPU backend.
+
+    python -m detection.inference.parity --backend onnx
+    python -m detection.inference.parity --backend onnx --model models/best.int8.onnx
+
+Runs both backends over a held-out slice of `metadata.csv` and exits non-zero
+when the candidate's top-1 class agrees with the PyTorch model on too few
+images or its accuracy against the ground-truth labels drops too far.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from detection.inference.backends import BACKENDS, DEFAULT_MODEL_PATHS, build_backend
+from detection.processing.constants import CLASS_MAPPING
+
+
+def held_out_slice(metadata_file: str, fraction: float, limit: int) -> pd.DataFrame:
+    """Stable pseudo-random slice: an image is held out based on a hash of its id."""
+    df = pd.read_csv(metadata_file)
+    buckets = df["image"].map(lambda image_id: int(hashlib.sha1(image_id.encode()).hexdigest()[:8], 16) % 10_000)
+    df = df[buckets < fraction * 10_000]
+    df = df.assign(label=df[list(CLASS_MAPPING)].to_numpy().argmax(axis=1))
+    return df.head(limit) if limit else df
+
+
+def top_prediction(boxes: np.ndarray):
+    """Highest-confidence box as `(class_id, confidence, xyxy)`, or None."""
+    if not len(boxes):
+        return None
+    best = boxes[boxes[:, 4].argmax()]
+    return int(best[5]), float(best[4]), best[:4]
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> float:
+    w = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    h = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = w * h
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def compare(reference, candidate, df: pd.DataFrame, images_dir: str, imgsz: int, batch_size: int) -> dict:
+    import cv2
+
+    rows = [row for row in df.itertuples() if os.path.exists(os.path.join(images_dir, f"{row.image}.jpg"))]
+    if not rows:
+        raise FileNotFoundError(f"None of the held-out images were found in {images_dir}")
+
+    ref_names = {v: k for k, v in reference.names.items()}
+    agree, ref_correct, cand_correct, ious, conf_deltas = 0, 0, 0, [], []
+
+    for start in range(0, len(rows), batch_size):
+        chunk = rows[start:start + batch_size]
+        images = [cv2.imread(os.path.join(images_dir, f"{row.image}.jpg")) for row in chunk]
+        ref_boxes = reference.predict(images, imgsz=imgsz)
+        cand_boxes = candidate.predict(images, imgsz=imgsz)
+
+        for row, ref, cand in zip(chunk, ref_boxes, cand_boxes):
+            ref_top, cand_top = top_prediction(ref), top_prediction(cand)
+            truth = ref_names.get(list(CLASS_MAPPING)[row.label])
+            ref_cls = ref_top[0] if ref_top else None
+            cand_cls = cand_top[0] if cand_top else None
+
+            agree += ref_cls == cand_cls
+            ref_correct += ref_cls == truth
+            cand_correct += cand_cls == truth
+            if ref_top and cand_top and ref_cls == cand_cls:
+                ious.append(box_iou(ref_top[2], cand_top[2]))
+                conf_deltas.append(abs(ref_top[1] - cand_top[1]))
+
+    total = len(rows)
+    return {
+        "images": total,
+        "top1_agreement": round(agree / total, 4),
+        "reference_accuracy": round(ref_correct / total, 4),
+        "candidate_accuracy": round(cand_correct / total, 4),
+        "mean_top_box_iou": round(float(np.mean(ious)), 4) if ious else None,
+        "mean_confidence_delta": round(float(np.mean(conf_deltas)), 4) if conf_deltas else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check a CPU backend against the PyTorch model.")
+    parser.add_argument("--backend", default="onnx", choices=[b for b in BACKENDS if b != "pytorch"])
+    parser.add_argument("--model", default=None, help="Candidate model path; defaults to the standard export path")
+    parser.add_argument("--reference", default=DEFAULT_MODEL_PATHS["pytorch"])
+    parser.add_argument("--data-dir", default="detection/data")
+    parser.add_argument("--fraction", type=float, default=0.1, help="Share of metadata.csv held out")
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--imgsz", type=int, default=640, help="Same as DETECT_IMGSZ in production")
+    parser.add_argument("--conf-threshold", type=float, default=0.25, help="Same as DETECT_CONF_THRESHOLD")
+    parser.add_argument("--iou-threshold", type=float, default=0.7, help="Same as DETECT_IOU_THRESHOLD")
+    parser.add_argument("--threads", type=int, default=0, help="Same as INFERENCE_THREADS; 0 = all cores")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--min-agreement", type=float, default=0.98)
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.01)
+    args = parser.parse_args()
+
+    df = held_out_slice(os.path.join(args.data_dir, "metadata.csv"), args.fraction, args.limit)
+    settings = dict(threads=args.threads, conf_threshold=args.conf_threshold, iou_threshold=args.iou_threshold)
+    reference = build_backend("pytorch", args.reference, **settings)
+    candidate = build_backend(args.backend, args.model or DEFAULT_MODEL_PATHS[args.backend], **settings)
+
+    report = compare(reference, candidate, df, os.path.join(args.data_dir, "images"), args.imgsz, args.batch_size)
+    report.update(backend=candidate.name, model=candidate.model_path)
+
+    accuracy_drop = report["reference_accuracy"] - report["candidate_accuracy"]
+    report["passed"] = report["top1_agreement"] >= args.min_agreement and accuracy_drop <= args.max_accuracy_drop
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
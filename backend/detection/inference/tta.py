@@ -0,0 +1,123 @@
+"""
+Test-time augmentation: the same image is run at several input sizes and
+flips, the boxes of every pass are mapped back onto the original image and
+merged with weighted box fusion (Solovyev et al., 2021).
+
+Passes that share an input size are submitted together, so the batch
+service runs each size as a single forward pass over all of its flips.
+"""
+
+from typing import List, NamedTuple, Sequence
+
+import numpy as np
+
+
+class TTABudgetExceeded(Exception):
+    """The augmented passes did not finish within the latency budget."""
+
+
+class Variant(NamedTuple):
+    imgsz: int
+    flip: str  # "", "h" or "v"
+
+
+def plan(base_imgsz: int, scales: Sequence[int], flips: Sequence[str]) -> List[Variant]:
+    """Every scale x flip combination, with the plain pass at `base_imgsz` first."""
+    variants = [Variant(base_imgsz, "")]
+    for imgsz in sorted(set(scales) | {base_imgsz}):
+        for flip in ("", *flips):
+            if (imgsz, flip) != (base_imgsz, ""):
+                variants.append(Variant(imgsz, flip))
+    return variants
+
+
+def relative_cost(variants: Sequence[Variant], base_imgsz: int) -> float:
+    """Forward passes needed, in units of one plain batch at `base_imgsz` (cost grows with pixel count)."""
+    return sum((imgsz / base_imgsz) ** 2 for imgsz in {variant.imgsz for variant in variants})
+
+
+def apply_flip(image: np.ndarray, flip: str) -> np.ndarray:
+    if flip == "h":
+        return np.ascontiguousarray(image[:, ::-1])
+    if flip == "v":
+        return np.ascontiguousarray(image[::-1])
+    return image
+
+
+def unflip_boxes(boxes: np.ndarray, flip: str, width: int, height: int) -> np.ndarray:
+    """Maps `[x1, y1, x2, y2, conf, cls]` rows predicted on a flipped image back onto the original."""
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 6).copy()
+    if flip == "h":
+        boxes[:, [0, 2]] = width - boxes[:, [2, 0]]
+    elif flip == "v":
+        boxes[:, [1, 3]] = height - boxes[:, [3, 1]]
+    return boxes
+
+
+def _iou(box: np.ndarray, others: np.ndarray) -> np.ndarray:
+    x1 = np.maximum(box[0], others[:, 0])
+    y1 = np.maximum(box[1], others[:, 1])
+    x2 = np.minimum(box[2], others[:, 2])
+    y2 = np.minimum(box[3], others[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (others[:, 2] - others[:, 0]) * (others[:, 3] - others[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def weighted_boxes_fusion(box_sets: Sequence[np.ndarray], iou_threshold: float = 0.55,
+                          skip_threshold: float = 0.0, conf_threshold: float = 0.0) -> np.ndarray:
+    """
+    Fuses per-pass `[x1, y1, x2, y2, conf, cls]` arrays into one.
+
+    Boxes of the same class are clustered greedily in descending confidence
+    whenever they overlap a cluster's fused box by more than
+    `iou_threshold`. A cluster's box is the confidence-weighted mean of its
+    members, and its confidence is their mean, scaled down when fewer of the
+    `len(box_sets)` passes found it, so a box seen by one pass out of six
+    counts for little however many boxes that pass put there. Input boxes
+    under `skip_threshold` are ignored, fused ones under `conf_threshold`
+    dropped.
+    """
+    passes = len(box_sets)
+    # A seventh column remembers which pass each box came from.
+    rows = []
+    for index, pass_boxes in enumerate(box_sets):
+        pass_boxes = np.asarray(pass_boxes, dtype=np.float32).reshape(-1, 6)
+        rows.append(np.column_stack([pass_boxes, np.full(len(pass_boxes), index, dtype=np.float32)]))
+    boxes = np.concatenate(rows) if rows else np.zeros((0, 7), dtype=np.float32)
+    boxes = boxes[boxes[:, 4] >= skip_threshold]
+    if not len(boxes) or not passes:
+        return np.zeros((0, 6), dtype=np.float32)
+
+    fused_rows = []
+    for cls in np.unique(boxes[:, 5]):
+        members = boxes[boxes[:, 5] == cls]
+        members = members[np.argsort(-members[:, 4], kind="stable")]
+        clusters: List[List[np.ndarray]] = []
+        fused = np.zeros((0, 6), dtype=np.float32)
+        for box in members:
+            if len(fused):
+                overlaps = _iou(box, fused)
+                best = int(np.argmax(overlaps))
+                if overlaps[best] > iou_threshold:
+                    clusters[best].append(box)
+                    fused[best] = _fuse(clusters[best])
+                    continue
+            clusters.append([box])
+            fused = np.vstack([fused, box[:6]])
+
+        for index, cluster in enumerate(clusters):
+            fused[index, 4] *= len({int(box[6]) for box in cluster}) / passes
+        fused_rows.append(fused)
+
+    result = np.concatenate(fused_rows)
+    result = result[result[:, 4] >= conf_threshold]
+    return result[np.argsort(-result[:, 4], kind="stable")]
+
+
+def _fuse(cluster: List[np.ndarray]) -> np.ndarray:
+    members = np.stack(cluster)
+    weights = members[:, 4:5]
+    coords = (members[:, :4] * weights).sum(axis=0) / weights.sum()
+    return np.concatenate([coords, [members[:, 4].mean(), members[0, 5]]]).astype(np.float32)
@@ -1,12 +1,27 @@
+"""
+Converts segmentation masks into YOLO-format label files.
+
+    python -m detection.processing.convert_masks_to_labels --workers 8
+
+Masks are decoded and their contours extracted on a process pool. A label
+file that is newer than its mask is left alone, so an interrupted or repeated
+run only converts what changed; pass --force to rebuild everything. Masks
+that fail to convert are listed at the end and make the run exit non-zero.
+"""
+
+import argparse
 import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
 import cv2
-import pandas as pd
 import numpy as np
-from detection.processing.constants import METADATA_FILE, MASKS_PATH, LABELS_PATH, CLASS_MAPPING
+import pandas as pd
 
-os.makedirs(LABELS_PATH, exist_ok=True)
+from detection.processing.constants import METADATA_FILE, MASKS_PATH, LABELS_PATH, CLASS_MAPPING
 
-df = pd.read_csv(METADATA_FILE)
 
 def get_bounding_boxes(mask):
     boxes = []
@@ -16,25 +31,112 @@ def get_bounding_boxes(mask):
         boxes.append((x, y, w, h))
     return boxes
 
-for _, row in df.iterrows():
-    image_id = row["image"]
-    mask_file = os.path.join(MASKS_PATH, f"{image_id}.png")
-    
-    if not os.path.exists(mask_file):
-        continue
-    
-    mask = cv2.imread(mask_file, cv2.IMREAD_GRAYSCALE)
-    h, w = mask.shape
-    bounding_boxes = get_bounding_boxes(mask)
-    
-    class_id = np.argmax(row[1:].values)  
-    yolo_class = CLASS_MAPPING[list(CLASS_MAPPING.keys())[class_id]]
-    
-    label_file = os.path.join(LABELS_PATH, f"{image_id}.txt")
-    with open(label_file, "w") as f:
-        for x, y, bw, bh in bounding_boxes:
-            x_center = (x + bw / 2) / w
-            y_center = (y + bh / 2) / h
-            bw = bw / w
-            bh = bh / h
-            f.write(f"{yolo_class} {x_center} {y_center} {bw} {bh}\n")
+
+def resolve_classes(df: pd.DataFrame) -> np.ndarray:
+    """YOLO class id of every row, from the one-hot diagnosis columns."""
+    class_ids = np.asarray(list(CLASS_MAPPING.values()))
+    return class_ids[df[list(CLASS_MAPPING)].to_numpy().argmax(axis=1)]
+
+
+def is_up_to_date(mask_file: str, label_file: str) -> bool:
+    try:
+        return os.stat(label_file).st_mtime >= os.stat(mask_file).st_mtime
+    except FileNotFoundError:
+        return False
+
+
+def _init_worker():
+    # One process per core already; OpenCV's own threads would only compete.
+    cv2.setNumThreads(1)
+
+
+def convert_mask(task) -> Tuple[int, Optional[str]]:
+    """
+    Writes the label file for one mask. Returns the number of boxes in it and,
+    if the mask could not be converted, the error instead of raising it, so
+    one bad mask doesn't abort the rest of the run.
+    """
+    mask_file, label_file, yolo_class = task
+    # Written under a temporary name so an interrupted run never leaves a
+    # truncated label file that looks newer than its mask.
+    tmp_file = f"{label_file}.tmp"
+    try:
+        mask = cv2.imread(mask_file, cv2.IMREAD_GRAYSCALE)
+        if mask is None:
+            raise ValueError(f"Could not read mask {mask_file}")
+        h, w = mask.shape
+        bounding_boxes = get_bounding_boxes(mask)
+
+        with open(tmp_file, "w") as f:
+            for x, y, bw, bh in bounding_boxes:
+                x_center = (x + bw / 2) / w
+                y_center = (y + bh / 2) / h
+                bw = bw / w
+                bh = bh / h
+                f.write(f"{yolo_class} {x_center} {y_center} {bw} {bh}\n")
+        os.replace(tmp_file, label_file)
+        return len(bounding_boxes), None
+    except Exception as exc:
+        return 0, f"{type(exc).__name__}: {exc}"
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def plan(df: pd.DataFrame, masks_dir: str, labels_dir: str, force: bool):
+    """Splits the metadata rows into masks to convert, already converted ones and missing masks."""
+    tasks, up_to_date, missing = [], 0, 0
+    for image_id, yolo_class in zip(df["image"].to_numpy(), resolve_classes(df)):
+        mask_file = os.path.join(masks_dir, f"{image_id}.png")
+        label_file = os.path.join(labels_dir, f"{image_id}.txt")
+        if not os.path.exists(mask_file):
+            missing += 1
+        elif not force and is_up_to_date(mask_file, label_file):
+            up_to_date += 1
+        else:
+            tasks.append((mask_file, label_file, int(yolo_class)))
+    return tasks, up_to_date, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert segmentation masks into YOLO label files.")
+    parser.add_argument("--metadata", default=METADATA_FILE)
+    parser.add_argument("--masks-dir", default=MASKS_PATH)
+    parser.add_argument("--labels-dir", default=LABELS_PATH)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunksize", type=int, default=32, help="Masks handed to a worker at a time")
+    parser.add_argument("--force", action="store_true", help="Rebuild label files even if they are up to date")
+    args = parser.parse_args()
+
+    os.makedirs(args.labels_dir, exist_ok=True)
+    df = pd.read_csv(args.metadata)
+    tasks, up_to_date, missing = plan(df, args.masks_dir, args.labels_dir, args.force)
+    print(f"{len(df)} rows: {len(tasks)} to convert, {up_to_date} up to date, {missing} without a mask")
+
+    started = time.perf_counter()
+    boxes = 0
+    failed = []
+    if tasks:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+            results = pool.map(convert_mask, tasks, chunksize=args.chunksize)
+            for done, (task, (count, error)) in enumerate(zip(tasks, results), 1):
+                boxes += count
+                if error is not None:
+                    failed.append((task[0], error))
+                if done % 1000 == 0:
+                    elapsed = time.perf_counter() - started
+                    print(f"  {done}/{len(tasks)} ({done / elapsed:.1f} images/s)")
+
+    elapsed = time.perf_counter() - started
+    rate = len(tasks) / elapsed if elapsed > 0 else 0.0
+    print(f"Converted {len(tasks) - len(failed)} masks ({boxes} boxes) in {elapsed:.2f}s: "
+          f"{rate:.1f} images/s with {args.workers} workers")
+    if failed:
+        print(f"{len(failed)} masks failed:", file=sys.stderr)
+        for mask_file, error in failed:
+            print(f"  {mask_file}: {error}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Packs images, masks and YOLO labels into memory-mappable NumPy shards.
+
+    python -m detection.processing.pack_dataset --out detection/data/packed-640 --imgsz 640
+
+Images and masks are decoded and letterboxed once, on a process pool, so
+later training and evaluation passes read fixed-shape arrays sequentially
+instead of decoding JPEGs and PNGs. Read the result with
+`detection.processing.packed_dataset.PackedDataset`.
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from detection.inference.backends import letterbox
+from detection.processing.constants import METADATA_FILE, IMAGES_PATH, MASKS_PATH, LABELS_PATH, CLASS_MAPPING
+from detection.processing.convert_masks_to_labels import resolve_classes
+from detection.processing.packed_dataset import INDEX_DTYPE, shard_name
+
+
+def _init_worker():
+    cv2.setNumThreads(1)
+
+
+def read_labels(label_file: str, width: int, height: int) -> np.ndarray:
+    """YOLO `cls xc yc w h` lines -> `[cls, x1, y1, x2, y2]` in original-image pixels."""
+    if not os.path.exists(label_file):
+        return np.zeros((0, 5), dtype=np.float32)
+    rows = np.loadtxt(label_file, dtype=np.float32, ndmin=2)
+    if not rows.size:
+        return np.zeros((0, 5), dtype=np.float32)
+    cls, xc, yc, w, h = rows[:, :5].T
+    return np.stack([
+        cls,
+        (xc - w / 2) * width, (yc - h / 2) * height,
+        (xc + w / 2) * width, (yc + h / 2) * height,
+    ], axis=1)
+
+
+def pack_one(task):
+    """Decodes and letterboxes one image and its mask; returns arrays and index fields."""
+    image_file, mask_file, label_file, imgsz = task
+    image = cv2.imread(image_file)
+    if image is None:
+        raise ValueError(f"Could not read image {image_file}")
+    orig_h, orig_w = image.shape[:2]
+    packed, gain, (left, top) = letterbox(image, imgsz)
+
+    packed_mask = np.zeros((imgsz, imgsz), dtype=np.uint8)
+    mask = cv2.imread(mask_file, cv2.IMREAD_GRAYSCALE) if os.path.exists(mask_file) else None
+    if mask is not None:
+        new_w, new_h = round(orig_w * gain), round(orig_h * gain)
+        packed_mask[top:top + new_h, left:left + new_w] = cv2.resize(mask, (new_w, new_h), interpolation=cv2.INTER_NEAREST)
+
+    boxes = read_labels(label_file, orig_w, orig_h)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]] * gain + left
+    boxes[:, [2, 4]] = boxes[:, [2, 4]] * gain + top
+    meta = {
+        "orig_height": orig_h, "orig_width": orig_w, "gain": gain,
+        "pad_left": left, "pad_top": top, "has_mask": mask is not None,
+    }
+    return packed, packed_mask, boxes, meta
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack the dataset into memory-mappable shards.")
+    parser.add_argument("--out", required=True, help="Output directory")
+    parser.add_argument("--metadata", default=METADATA_FILE)
+    parser.add_argument("--images-dir", default=IMAGES_PATH)
+    parser.add_argument("--masks-dir", default=MASKS_PATH)
+    parser.add_argument("--labels-dir", default=LABELS_PATH)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--shard-size", type=int, default=1024, help="Images per shard")
+    parser.add_argument("--limit", type=int, default=0, help="Pack only the first N images")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.metadata)
+    df = df.assign(label=resolve_classes(df))
+    df = df[[os.path.exists(os.path.join(args.images_dir, f"{image_id}.jpg")) for image_id in df["image"]]]
+    if args.limit:
+        df = df.head(args.limit)
+    total = len(df)
+    if not total:
+        raise SystemExit(f"No images from {args.metadata} found in {args.images_dir}")
+
+    os.makedirs(args.out, exist_ok=True)
+    index = np.zeros(total, dtype=INDEX_DTYPE)
+    index["image_id"] = df["image"].to_numpy()
+    index["label"] = df["label"].to_numpy()
+    index["shard"], index["row"] = np.divmod(np.arange(total), args.shard_size)
+
+    tasks = [
+        (
+            os.path.join(args.images_dir, f"{image_id}.jpg"),
+            os.path.join(args.masks_dir, f"{image_id}.png"),
+            os.path.join(args.labels_dir, f"{image_id}.txt"),
+            args.imgsz,
+        )
+        for image_id in df["image"]
+    ]
+
+    started = time.perf_counter()
+    all_boxes, box_start = [], 0
+    images = masks = None
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+        for i, (image, mask, boxes, meta) in enumerate(pool.map(pack_one, tasks, chunksize=16)):
+            shard, row = divmod(i, args.shard_size)
+            if row == 0:
+                # Records are written in order, so shard and row follow from the position.
+                count = min(args.shard_size, total - i)
+                images = np.lib.format.open_memmap(
+                    os.path.join(args.out, shard_name("images", shard)), mode="w+",
+                    dtype=np.uint8, shape=(count, args.imgsz, args.imgsz, 3),
+                )
+                masks = np.lib.format.open_memmap(
+                    os.path.join(args.out, shard_name("masks", shard)), mode="w+",
+                    dtype=np.uint8, shape=(count, args.imgsz, args.imgsz),
+                )
+            images[row] = image
+            masks[row] = mask
+            for field, value in meta.items():
+                index[field][i] = value
+            index["box_start"][i], index["box_count"][i] = box_start, len(boxes)
+            all_boxes.append(boxes)
+            box_start += len(boxes)
+            if (i + 1) % 1000 == 0:
+                print(f"  {i + 1}/{total} ({(i + 1) / (time.perf_counter() - started):.1f} images/s)")
+    del images, masks
+
+    np.save(os.path.join(args.out, "boxes.npy"), np.concatenate(all_boxes).astype(np.float32))
+    np.save(os.path.join(args.out, "index.npy"), index)
+    with open(os.path.join(args.out, "manifest.json"), "w") as f:
+        json.dump({
+            "imgsz": args.imgsz,
+            "shard_size": args.shard_size,
+            "shards": int(index["shard"].max()) + 1,
+            "records": total,
+            "boxes": box_start,
+            "names": {v: k for k, v in CLASS_MAPPING.items()},
+        }, f, indent=2)
+
+    elapsed = time.perf_counter() - started
+    print(f"Packed {total} images ({box_start} boxes) into {args.out} in {elapsed:.1f}s: {total / elapsed:.1f} images/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Reader for datasets packed by `detection.processing.pack_dataset`.
+
+A packed dataset is a directory of fixed-shape NumPy shards plus an index:
+
+    manifest.json          imgsz, shard size, class names, record count
+    index.npy              one structured row per image (see INDEX_DTYPE)
+    boxes.npy              (M, 5) float32 [cls, x1, y1, x2, y2] in packed-image pixels
+    images-00000.npy       (n, imgsz, imgsz, 3) uint8 BGR, letterboxed like Ultralytics
+    masks-00000.npy        (n, imgsz, imgsz) uint8, letterboxed the same way
+
+Every array is opened with `mmap_mode="r"`, so reading a record or a slice
+within one shard returns views into the page cache instead of copies.
+"""
+
+import json
+import os
+from typing import Dict
+
+import numpy as np
+
+INDEX_DTYPE = np.dtype([
+    ("image_id", "U32"),
+    ("label", "i2"),         # YOLO class id from metadata.csv
+    ("shard", "i4"),
+    ("row", "i4"),           # position inside the shard
+    ("orig_height", "i4"),
+    ("orig_width", "i4"),
+    ("gain", "f4"),          # packed = original * gain + (pad_left, pad_top)
+    ("pad_left", "i2"),
+    ("pad_top", "i2"),
+    ("has_mask", "?"),
+    ("box_start", "i8"),     # rows [box_start, box_start + box_count) of boxes.npy
+    ("box_count", "i4"),
+])
+
+
+def shard_name(kind: str, shard: int) -> str:
+    return f"{kind}-{shard:05d}.npy"
+
+
+class PackedDataset:
+    """Random access to a packed dataset; see the module docstring for the layout."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self.imgsz = self.manifest["imgsz"]
+        self.shard_size = self.manifest["shard_size"]
+        self.names: Dict[int, str] = {int(k): v for k, v in self.manifest["names"].items()}
+        self.index = np.load(os.path.join(path, "index.npy"), mmap_mode="r")
+        self.boxes = np.load(os.path.join(path, "boxes.npy"), mmap_mode="r")
+        self._shards: Dict[tuple, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _shard(self, kind: str, shard: int) -> np.ndarray:
+        key = (kind, shard)
+        if key not in self._shards:
+            self._shards[key] = np.load(os.path.join(self.path, shard_name(kind, shard)), mmap_mode="r")
+        return self._shards[key]
+
+    def __getitem__(self, i: int) -> dict:
+        entry = self.index[i]
+        shard, row = int(entry["shard"]), int(entry["row"])
+        start = int(entry["box_start"])
+        return {
+            "image_id": str(entry["image_id"]),
+            "label": int(entry["label"]),
+            "image": self._shard("images", shard)[row],
+            "mask": self._shard("masks", shard)[row],
+            "boxes": self.boxes[start:start + int(entry["box_count"])],
+            "meta": entry,
+        }
+
+    def images(self, start: int, stop: int) -> np.ndarray:
+        """
+        Images `start:stop` as one `(n, imgsz, imgsz, 3)` array. A zero-copy
+        view when the range lies in one shard, otherwise a concatenated copy.
+        """
+        return self._slice("images", start, stop)
+
+    def masks(self, start: int, stop: int) -> np.ndarray:
+        return self._slice("masks", start, stop)
+
+    def _slice(self, kind: str, start: int, stop: int) -> np.ndarray:
+        start, stop, _ = slice(start, stop).indices(len(self))
+        parts = []
+        while start < stop:
+            shard, row = divmod(start, self.shard_size)
+            take = min(stop - start, self.shard_size - row)
+            parts.append(self._shard(kind, shard)[row:row + take])
+            start += take
+        if not parts:
+            shape = (0, self.imgsz, self.imgsz, 3) if kind == "images" else (0, self.imgsz, self.imgsz)
+            return np.empty(shape, dtype=np.uint8)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def original_boxes(self, i: int) -> np.ndarray:
+        """Boxes of record `i` as `[cls, x1, y1, x2, y2]` in original-image pixels."""
+        entry = self.index[i]
+        boxes = np.array(self[i]["boxes"], dtype=np.float32)
+        boxes[:, [1, 3]] = (boxes[:, [1, 3]] - entry["pad_left"]) / entry["gain"]
+        boxes[:, [2, 4]] = (boxes[:, [2, 4]] - entry["pad_top"]) / entry["gain"]
+        return boxes
@@ -1,17 +1,137 @@
+import importlib.util
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
 from config.config import get_config
+from internal.utils.logger import logger
+from internal.utils.metrics import MongoCommandMetrics, MongoPoolMetrics
 from bson.objectid import ObjectId
 from typing import Optional
 import io
 
 mongodb_uri = get_config("MONGO_URI")
 mongodb_name = get_config("MONGODB_DATABASE")
-print("DEBUG: mongodb_name =", mongodb_name)
 
-client = AsyncIOMotorClient(mongodb_uri)
-db = client[mongodb_name]
+# Python module each wire compressor needs; zlib is in the standard library.
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
 
-fs_bucket = AsyncIOMotorGridFSBucket(db)
+_client: Optional[AsyncIOMotorClient] = None
+_fs_bucket: Optional[AsyncIOMotorGridFSBucket] = None
+
+
+def client_options() -> dict:
+    """Pool, timeout, compression and consistency settings from config, as pymongo keyword options."""
+    options = {
+        "maxPoolSize": get_config("mongo_max_pool_size"),
+        "minPoolSize": get_config("mongo_min_pool_size"),
+        "connectTimeoutMS": get_config("mongo_connect_timeout_ms"),
+        "serverSelectionTimeoutMS": get_config("mongo_server_selection_timeout_ms"),
+        "readPreference": get_config("mongo_read_preference"),
+    }
+    # 0 means "no limit" in config; pymongo wants those left unset.
+    for key, name in (
+        ("maxIdleTimeMS", "mongo_max_idle_time_ms"),
+        ("socketTimeoutMS", "mongo_socket_timeout_ms"),
+        ("waitQueueTimeoutMS", "mongo_wait_queue_timeout_ms"),
+        ("wTimeoutMS", "mongo_write_concern_timeout_ms"),
+    ):
+        if get_config(name):
+            options[key] = get_config(name)
+
+    write_concern = get_config("mongo_write_concern")
+    if write_concern:
+        options["w"] = int(write_concern) if write_concern.isdigit() else write_concern
+
+    compressors = [
+        name.strip() for name in get_config("mongo_compressors").split(",")
+        if name.strip() in _COMPRESSOR_MODULES and importlib.util.find_spec(_COMPRESSOR_MODULES[name.strip()])
+    ]
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    return options
+
+
+def connect(client: Optional[AsyncIOMotorClient] = None) -> AsyncIOMotorClient:
+    """
+    Creates the shared client, called from the app lifespan (and by scripts
+    that use the database outside the app). A prebuilt `client` can be passed
+    in instead, e.g. a mongomock one. Does nothing if already connected.
+    """
+    global _client, _fs_bucket
+    if _client is None:
+        if client is None:
+            options = client_options()
+            client = AsyncIOMotorClient(
+                mongodb_uri,
+                event_listeners=[MongoCommandMetrics(), MongoPoolMetrics()],
+                **options,
+            )
+            logger.info(f"MongoDB client created for database {mongodb_name}: {options}")
+        _client = client
+        _fs_bucket = None
+    return _client
+
+
+def close():
+    global _client, _fs_bucket
+    if _client is not None:
+        _client.close()
+    _client = None
+    _fs_bucket = None
+
+
+def get_client() -> AsyncIOMotorClient:
+    if _client is None:
+        raise RuntimeError("MongoDB client is not connected; call internal.database.database.connect() first")
+    return _client
+
+
+def get_database():
+    return get_client()[mongodb_name]
+
+
+class LazyCollection:
+    """
+    Collection handle that can be created at import time; every attribute is
+    looked up on the real collection of the current client.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_database()[self.name], attr)
+
+    def __repr__(self):
+        return f"LazyCollection({self.name!r})"
+
+
+class LazyDatabase:
+    """`db.users` / `db["users"]` at import time, without needing a client yet."""
+
+    def __init__(self):
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> LazyCollection:
+        if name not in self._collections:
+            self._collections[name] = LazyCollection(name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> LazyCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+
+class LazyGridFSBucket:
+    def __getattr__(self, attr):
+        global _fs_bucket
+        if _fs_bucket is None:
+            _fs_bucket = AsyncIOMotorGridFSBucket(get_database())
+        return getattr(_fs_bucket, attr)
+
+
+db = LazyDatabase()
+
+fs_bucket = LazyGridFSBucket()
 
 user_collection = db.users
 access_token_collection = db.access_tokens
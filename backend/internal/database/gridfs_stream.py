@@ -0,0 +1,179 @@
+import asyncio
+import re
+import time
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.responses import Response, StreamingResponse
+from gridfs.errors import NoFile
+
+from config.config import conf
+from internal.database.database import fs_bucket
+from internal.utils.metrics import observe_stage, stage_timer
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: str, length: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single-range `Range` header into inclusive `(start, end)`.
+    Returns None when the header should be ignored (malformed or multi-range)
+    and raises 416 when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # Suffix range: the last N bytes.
+        suffix = int(last)
+        if suffix == 0:
+            raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{length}"})
+        return max(0, length - suffix), length - 1
+
+    start = int(first)
+    end = min(int(last), length - 1) if last else length - 1
+    if start >= length or start > end:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{length}"})
+    return start, end
+
+
+def _not_modified(request: Request, etag: str, last_modified) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def _range_allowed(request: Request, etag: str, last_modified_header: str) -> bool:
+    if_range = request.headers.get("if-range")
+    return if_range is None or if_range.strip() in (etag, last_modified_header)
+
+
+async def gridfs_file_response(request: Request, file_id, media_type: str) -> Response:
+    """
+    Streams a GridFS file chunk by chunk instead of loading it into memory.
+
+    GridFS files are never modified in place, so the file id is a strong
+    ETag. Supports conditional requests (304) and single byte ranges (206).
+    """
+    try:
+        grid_out = await fs_bucket.open_download_stream(file_id)
+    except NoFile:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    length = grid_out.length
+    etag = f'"{grid_out._id}"'
+    last_modified = grid_out.upload_date.replace(tzinfo=timezone.utc)
+    last_modified_header = format_datetime(last_modified, usegmt=True)
+
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified_header,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, no-cache",
+    }
+
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    start, end, status_code = 0, length - 1, 200
+    range_header = request.headers.get("range")
+    if range_header and length and _range_allowed(request, etag, last_modified_header):
+        byte_range = parse_range(range_header, length)
+        if byte_range:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+
+    headers["Content-Length"] = str(max(0, end - start + 1))
+
+    async def iter_chunks():
+        started = time.perf_counter()
+        try:
+            grid_out.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await grid_out.readchunk()
+                if not chunk:
+                    break
+                chunk = chunk[:remaining]
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            # Includes time spent waiting on the client to take each chunk,
+            # and is recorded for downloads the client abandoned as well.
+            observe_stage("gridfs_download", time.perf_counter() - started)
+
+    return StreamingResponse(iter_chunks(), status_code=status_code, headers=headers, media_type=media_type)
+
+
+async def upload_to_gridfs(upload: UploadFile, max_bytes: int):
+    """
+    Pipes an upload into GridFS one chunk at a time, so memory use does not
+    depend on file size. Aborts the GridFS file and raises 413 as soon as
+    more than `max_bytes` have been read.
+    """
+    too_large = HTTPException(
+        status_code=413,
+        detail=f"{upload.filename or 'File'} exceeds the size limit of {max_bytes} bytes",
+    )
+    if upload.size is not None and upload.size > max_bytes:
+        raise too_large
+
+    grid_in = fs_bucket.open_upload_stream(
+        upload.filename,
+        chunk_size_bytes=conf["gridfs_chunk_bytes"],
+        metadata={"content_type": upload.content_type},
+    )
+    written = 0
+    try:
+        with stage_timer("gridfs_upload"):
+            while True:
+                chunk = await upload.read(conf["gridfs_chunk_bytes"])
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise too_large
+                await grid_in.write(chunk)
+            await grid_in.close()
+    except BaseException:
+        await grid_in.abort()
+        raise
+    return grid_in._id
+
+
+async def upload_many_to_gridfs(*uploads: Tuple[UploadFile, int]):
+    """
+    Uploads several `(file, max_bytes)` pairs concurrently and returns their
+    GridFS ids in order. If any of them fails, the ones that succeeded are
+    deleted so no orphaned files are left behind.
+    """
+    results = await asyncio.gather(
+        *(upload_to_gridfs(upload, max_bytes) for upload, max_bytes in uploads),
+        return_exceptions=True,
+    )
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        for file_id in results:
+            if not isinstance(file_id, BaseException):
+                await fs_bucket.delete(file_id)
+        raise errors[0]
+    return results
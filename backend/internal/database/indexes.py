@@ -0,0 +1,153 @@
+"""
+Index bootstrap and query-plan check for the hot collections.
+
+    python -m internal.database.indexes            # create missing indexes
+    python -m internal.database.indexes --check    # ... then explain() the hot queries
+
+Index creation is idempotent: indexes that already exist with the same
+options are left alone. The check exits non-zero if any hot query is
+planned as a COLLSCAN.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from typing import List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+from internal.database.database import connect, db
+from internal.utils.logger import logger
+
+# Verification codes are only accepted for 15 minutes (see verify_code).
+VERIFICATION_CODE_TTL_SECONDS = 15 * 60
+# Finished and failed jobs are kept this long for inspection, without their payload.
+FINISHED_JOB_TTL_SECONDS = 7 * 24 * 3600
+
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True, sparse=True),
+    ],
+    "access_tokens": [
+        IndexModel([("token", ASCENDING)], name="token_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("is_active", ASCENDING)], name="user_active"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "refresh_tokens": [
+        IndexModel([("token", ASCENDING)], name="token_unique", unique=True),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "lesion_reports": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="user_created"),
+        IndexModel(
+            [("user_id", ASCENDING), ("risk_level", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="user_risk_created",
+        ),
+    ],
+    "jobs": [
+        IndexModel([("type", ASCENDING), ("status", ASCENDING), ("run_at", ASCENDING)], name="type_status_run_at"),
+        IndexModel([("type", ASCENDING), ("status", ASCENDING), ("lease_until", ASCENDING)], name="type_status_lease"),
+        IndexModel([("finished_at", ASCENDING)], name="finished_at_ttl", expireAfterSeconds=FINISHED_JOB_TTL_SECONDS),
+    ],
+    "verification_codes": [
+        IndexModel([("email", ASCENDING), ("code", ASCENDING)], name="email_code"),
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=VERIFICATION_CODE_TTL_SECONDS),
+    ],
+}
+
+# (collection, filter, sort) for every query on a request path.
+HOT_QUERIES = [
+    ("users", {"email": "probe@example.com"}, None),
+    ("users", {"id": "probe"}, None),
+    ("access_tokens", {"token": "probe"}, None),
+    ("access_tokens", {"user_id": "probe", "is_active": True}, None),
+    ("refresh_tokens", {"token": "probe"}, None),
+    ("lesion_reports", {"user_id": "probe"}, [("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ("lesion_reports", {"user_id": "probe", "risk_level": "High risk"}, [("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ("verification_codes", {"email": "probe@example.com", "code": "probe"}, None),
+    ("jobs", {"type": "probe", "status": "pending", "run_at": {"$lte": 0}}, [("run_at", ASCENDING)]),
+]
+
+
+async def ensure_indexes(database=db) -> List[str]:
+    """Creates every index in INDEXES and returns the ones that could not be created."""
+    failed = []
+    for collection_name, indexes in INDEXES.items():
+        collection = database[collection_name]
+        for index in indexes:
+            name = index.document["name"]
+            try:
+                await collection.create_indexes([index])
+            except ConnectionFailure:
+                raise
+            except PyMongoError as exc:
+                # Usually duplicate data under a unique index or an existing
+                # index with the same keys but different options.
+                logger.error(f"Could not create index {collection_name}.{name}: {exc}")
+                failed.append(f"{collection_name}.{name}")
+    return failed
+
+
+def _stages(plan):
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _stages(item)
+
+
+async def collection_scans(database=db) -> List[dict]:
+    """Runs explain() on each hot query and returns the ones whose winning plan scans the collection."""
+    scans = []
+    for collection_name, query, sort in HOT_QUERIES:
+        cursor = database[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in set(_stages(winning_plan)):
+            scans.append({"collection": collection_name, "query": query, "sort": sort})
+    return scans
+
+
+async def bootstrap(check: bool = False):
+    """Startup hook: ensures the indexes and, with `check`, refuses to start on a COLLSCAN."""
+    try:
+        failed = await ensure_indexes()
+    except ConnectionFailure as exc:
+        logger.warning(f"Skipping index bootstrap, MongoDB is unreachable: {exc}")
+        return
+    if not check:
+        return
+    scans = await collection_scans()
+    for scan in scans:
+        logger.error(f"Query on {scan['collection']} does a COLLSCAN: {scan['query']}")
+    if scans or failed:
+        raise RuntimeError(f"Index check failed: {len(failed)} index(es) missing, {len(scans)} collection scan(s)")
+
+
+async def main_async(args):
+    connect()
+    failed = await ensure_indexes()
+    report = {"failed_indexes": failed}
+    if args.check:
+        report["collection_scans"] = await collection_scans()
+    print(json.dumps(report, indent=2, default=str))
+    return not failed and not report.get("collection_scans")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create MongoDB indexes and check the hot query plans.")
+    parser.add_argument("--check", action="store_true", help="Fail if any hot query does a COLLSCAN")
+    ok = asyncio.run(main_async(parser.parse_args()))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+from pymongo import DESCENDING
+
+# Newest first; _id breaks ties between documents created in the same millisecond.
+KEYSET_SORT = [("created_at", DESCENDING), ("_id", DESCENDING)]
+
+
+def encode_cursor(doc: dict) -> str:
+    """Opaque cursor pointing just past `doc` in KEYSET_SORT order."""
+    raw = json.dumps({"t": doc["created_at"].isoformat(), "id": str(doc["_id"])}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Turns a cursor from encode_cursor back into a filter for the next page."""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        created_at, last_id = datetime.fromisoformat(raw["t"]), ObjectId(raw["id"])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": last_id}},
+    ]}
+
+
+async def keyset_page(collection, query: dict, projection: dict, limit: int, cursor: Optional[str] = None):
+    """
+    Returns `(docs, next_cursor)` for one page of `query` in KEYSET_SORT order.
+    `next_cursor` is None on the last page.
+    """
+    if cursor:
+        query = {"$and": [query, decode_cursor(cursor)]}
+    # One extra document tells us whether there is a next page.
+    docs = await collection.find(query, projection).sort(KEYSET_SORT).limit(limit + 1).to_list(length=limit + 1)
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
@@ -0,0 +1,101 @@
+import asyncio
+import io
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from bson import ObjectId
+from fastapi import HTTPException
+from gridfs.errors import NoFile
+
+from config.config import conf
+from internal.database.database import fs_bucket, report_collection
+from internal.jobs.queue import job_queue
+from internal.utils.logger import logger
+from internal.utils.metrics import timed
+
+# Longest side in pixels of each downscaled rendition of a report image.
+RENDITIONS = {
+    "thumb": conf["report_thumbnail_px"],
+    "preview": conf["report_preview_px"],
+}
+RENDITION_MEDIA_TYPE = "image/webp"
+
+_inflight: dict = {}
+
+
+def render(data: bytes, max_side: int) -> bytes:
+    """Downscales an image so its longest side is at most `max_side` and encodes it as WebP."""
+    try:
+        img = Image.open(io.BytesIO(data))
+        img.draft("RGB", (max_side, max_side))
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as exc:
+        raise HTTPException(status_code=415, detail="Report image cannot be rendered") from exc
+
+    out = io.BytesIO()
+    img.save(out, format="WEBP", quality=conf["report_rendition_quality"], method=4)
+    return out.getvalue()
+
+
+async def _create_rendition(report: dict, size: str):
+    try:
+        grid_out = await fs_bucket.open_download_stream(report["image_file_id"])
+    except NoFile:
+        raise HTTPException(status_code=404, detail="Image not found")
+    data = await grid_out.read()
+    rendered = await asyncio.to_thread(timed, "render_rendition", render, data, RENDITIONS[size])
+
+    file_id = await fs_bucket.upload_from_stream(
+        f"{report['_id']}-{size}.webp",
+        rendered,
+        metadata={"content_type": RENDITION_MEDIA_TYPE, "report_id": report["_id"], "rendition": size},
+    )
+    field = f"renditions.{size}"
+    result = await report_collection.update_one(
+        {"_id": report["_id"], field: {"$exists": False}},
+        {"$set": {field: file_id}},
+    )
+    if result.modified_count:
+        logger.info(f"Rendered {size} for report {report['_id']}: {len(data)} -> {len(rendered)} bytes")
+        return file_id
+
+    # Another worker got there first; keep theirs.
+    await fs_bucket.delete(file_id)
+    stored = await report_collection.find_one({"_id": report["_id"]}, {field: 1})
+    return stored["renditions"][size]
+
+
+async def get_rendition(report: dict, size: str):
+    """
+    GridFS id of the `size` rendition of a report's image. Renditions are
+    rendered lazily on first request and then referenced from the report, so
+    each one is only ever rendered once.
+    """
+    file_id = report.get("renditions", {}).get(size)
+    if file_id is not None:
+        return file_id
+
+    key = (report["_id"], size)
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_create_rendition(report, size))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def render_report_renditions(report_id: str):
+    """Job run after an upload so the first list view finds thumbnails ready."""
+    report = await report_collection.find_one({"_id": ObjectId(report_id)})
+    if report is None:
+        return
+    for size in RENDITIONS:
+        await get_rendition(report, size)
+
+
+job_queue.register(
+    "render_report_renditions",
+    render_report_renditions,
+    concurrency=conf["rendition_job_concurrency"],
+    max_attempts=3,
+)
@@ -1,19 +1,66 @@
-import aiosmtplib
 from email.message import EmailMessage
+from typing import List
 from config.config import get_config
+from internal.email.smtp_pool import SMTPPool
+from internal.jobs.queue import job_queue
+from internal.utils.logger import logger
 
-async def send_email(to: str, subject: str, content: str):
+smtp_pool = SMTPPool(
+    hostname=get_config("smtp_host"),
+    port=int(get_config("smtp_port")),
+    username=get_config("smtp_user"),
+    password=get_config("smtp_pass"),
+    use_tls=get_config("smtp_use_tls"),
+    size=get_config("smtp_pool_size"),
+    timeout=get_config("smtp_timeout"),
+    health_check_seconds=get_config("smtp_health_check_seconds"),
+    max_idle_seconds=get_config("smtp_max_idle_seconds"),
+    max_messages=get_config("smtp_max_messages_per_connection"),
+)
+
+
+def build_message(to: str, subject: str, content: str) -> EmailMessage:
     msg = EmailMessage()
     msg["From"] = get_config("smtp_user")
     msg["To"] = to
     msg["Subject"] = subject
     msg.set_content(content)
+    return msg
+
+
+async def deliver_email(to: str, subject: str, content: str):
+    await smtp_pool.send(build_message(to, subject, content))
+
+
+async def deliver_emails(emails: List[dict]):
+    """Sends a batch over one pooled connection; only the messages that failed are queued again."""
+    results = await smtp_pool.send_many([build_message(**email) for email in emails])
+    failed = [email for email, error in zip(emails, results) if error is not None]
+    if failed:
+        logger.warning(f"{len(failed)} of {len(emails)} emails in batch failed, retrying them individually")
+        for email in failed:
+            await job_queue.enqueue("send_email", email)
+
+
+job_queue.register(
+    "send_email",
+    deliver_email,
+    concurrency=get_config("email_job_concurrency"),
+    max_attempts=get_config("email_job_max_attempts"),
+)
+job_queue.register(
+    "send_email_batch",
+    deliver_emails,
+    concurrency=1,
+    max_attempts=get_config("email_job_max_attempts"),
+)
+
+
+async def send_email(to: str, subject: str, content: str):
+    """Queues the email; it is delivered by the job queue, with retries, after the request returns."""
+    await job_queue.enqueue("send_email", {"to": to, "subject": subject, "content": content})
+
 
-    await aiosmtplib.send(
-        msg,
-        hostname=get_config("smtp_host"),
-        port=int(get_config("smtp_port")),
-        username=get_config("smtp_user"),
-        password=get_config("smtp_pass"),
-        use_tls=True,
-    )
+async def send_emails(emails: List[dict]):
+    """Queues many `{"to", "subject", "content"}` emails to go out back to back over one SMTP connection."""
+    await job_queue.enqueue("send_email_batch", {"emails": emails})
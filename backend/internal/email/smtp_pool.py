@@ -0,0 +1,185 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from email.message import EmailMessage
+from typing import List, Optional
+
+import aiosmtplib
+
+from internal.utils.logger import logger
+from internal.utils.metrics import stage_timer
+
+# Errors after which a connection cannot be trusted for the next message.
+CONNECTION_ERRORS = (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError,
+                     aiosmtplib.SMTPTimeoutError, ConnectionError, OSError)
+# The server refused one message; the session is reset and stays usable.
+REJECTIONS = (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused, aiosmtplib.SMTPNotSupported)
+
+
+class _Connection:
+    def __init__(self, smtp: aiosmtplib.SMTP):
+        self.smtp = smtp
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.sent = 0
+
+
+class SMTPPool:
+    """
+    A bounded pool of long-lived, authenticated SMTP connections.
+
+    At most `size` connections exist at once; callers beyond that wait for
+    one to be released. A connection idle for more than `health_check_seconds`
+    is checked with NOOP before reuse, and one idle for more than
+    `max_idle_seconds` (most servers drop idle clients after a minute or so)
+    or that has carried `max_messages` is closed and replaced. Connection
+    level failures discard the connection and the message is retried once
+    on a fresh one; protocol rejections (bad recipient, ...) are raised.
+    """
+
+    def __init__(self, hostname: str, port: int, username: Optional[str] = None, password: Optional[str] = None,
+                 use_tls: bool = True, size: int = 4, timeout: float = 30, health_check_seconds: float = 10,
+                 max_idle_seconds: float = 60, max_messages: int = 100):
+        self.hostname = hostname
+        self.port = port
+        self.username = username or None
+        self.password = password or None
+        self.use_tls = use_tls
+        self.size = size
+        self.timeout = timeout
+        self.health_check_seconds = health_check_seconds
+        self.max_idle_seconds = max_idle_seconds
+        self.max_messages = max_messages
+
+        self._idle: List[_Connection] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.in_use = 0
+        self.connects = 0
+
+    async def _connect(self) -> _Connection:
+        smtp = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            use_tls=self.use_tls,
+            timeout=self.timeout,
+        )
+        with stage_timer("smtp_connect"):
+            await smtp.connect()
+        self.connects += 1
+        return _Connection(smtp)
+
+    async def _discard(self, conn: _Connection):
+        try:
+            if conn.smtp.is_connected:
+                await conn.smtp.quit()
+        except Exception:
+            conn.smtp.close()
+
+    async def _healthy(self, conn: _Connection) -> bool:
+        idle = time.monotonic() - conn.last_used
+        if not conn.smtp.is_connected or idle > self.max_idle_seconds or conn.sent >= self.max_messages:
+            return False
+        if idle <= self.health_check_seconds:
+            return True
+        try:
+            await conn.smtp.noop()
+            return True
+        except CONNECTION_ERRORS + (aiosmtplib.SMTPResponseException,):
+            return False
+
+    @asynccontextmanager
+    async def connection(self):
+        """Holds one pool slot and yields a live connection, returning it afterwards if still usable."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        async with self._slots:
+            conn = None
+            while self._idle:
+                candidate = self._idle.pop()
+                if await self._healthy(candidate):
+                    conn = candidate
+                    break
+                await self._discard(candidate)
+            if conn is None:
+                conn = await self._connect()
+
+            self.in_use += 1
+            try:
+                yield conn
+            except REJECTIONS:
+                self._idle.append(conn)
+                raise
+            except BaseException:
+                await self._discard(conn)
+                raise
+            else:
+                self._idle.append(conn)
+            finally:
+                self.in_use -= 1
+
+    async def _send_on(self, conn: _Connection, message: EmailMessage):
+        with stage_timer("smtp_send"):
+            await conn.smtp.send_message(message)
+        conn.sent += 1
+        conn.last_used = time.monotonic()
+
+    async def send(self, message: EmailMessage):
+        try:
+            async with self.connection() as conn:
+                await self._send_on(conn, message)
+        except CONNECTION_ERRORS as exc:
+            # Usually a pooled connection the server already dropped.
+            logger.warning(f"SMTP connection lost ({exc!r}), retrying on a new connection")
+            async with self.connection() as conn:
+                await self._send_on(conn, message)
+
+    async def send_many(self, messages: List[EmailMessage]) -> List[Optional[Exception]]:
+        """
+        Sends `messages` back to back over a single connection, reconnecting
+        if the server drops it mid-batch. Returns one entry per message:
+        None when accepted, otherwise the exception it was rejected with.
+        Raises only when no message could be handed to the server at all.
+        """
+        results: List[Optional[Exception]] = []
+        pending = list(messages)
+        failures = 0
+        while pending:
+            done = len(results)
+            try:
+                async with self.connection() as conn:
+                    while pending:
+                        if conn.sent >= self.max_messages:
+                            break
+                        try:
+                            await self._send_on(conn, pending[0])
+                            results.append(None)
+                        except REJECTIONS as exc:
+                            results.append(exc)
+                        pending.pop(0)
+            except CONNECTION_ERRORS as exc:
+                # Give up once a fresh connection fails before getting anything through.
+                failures = 0 if len(results) > done else failures + 1
+                if failures > 1:
+                    results.extend(exc for _ in pending)
+                    break
+                logger.warning(f"SMTP connection lost mid-batch ({exc!r}), reconnecting")
+            except aiosmtplib.SMTPException as exc:
+                # Only (re)connecting gets here, e.g. AUTH refused; per-message rejections are caught above.
+                if not results:
+                    raise
+                # Part of the batch is already sent: report the rest instead of raising,
+                # or the whole batch would be retried and the sent messages duplicated.
+                logger.warning(f"SMTP reconnect failed mid-batch ({exc!r}), {len(pending)} message(s) not sent")
+                results.extend(exc for _ in pending)
+                break
+        return results
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await self._discard(conn)
+
+    def stats(self) -> dict:
+        return {"idle": len(self._idle), "in_use": self.in_use, "connects": self.connects}
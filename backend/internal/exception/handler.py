@@ -9,7 +9,8 @@ from datetime import datetime
 async def http_exception_handler(request: Request, exc: StarletteHTTPException):
     return JSONResponse(
         status_code=exc.status_code,
-        content=create_api_error(request, exc.detail, ErrorCodes.HTTP_EXCEPTION)
+        content=create_api_error(request, exc.detail, ErrorCodes.HTTP_EXCEPTION),
+        headers=getattr(exc, "headers", None)
     )
 
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
@@ -0,0 +1,230 @@
+import asyncio
+import random
+import traceback
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from config.config import conf
+from internal.database.database import db
+from internal.utils.logger import logger
+
+job_collection = db.jobs
+
+
+class _JobType:
+    def __init__(self, handler: Callable[..., Awaitable], concurrency: int, max_attempts: int):
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.running = 0
+
+
+class JobQueue:
+    """
+    Background jobs persisted in MongoDB and run by a worker loop in every API
+    process.
+
+    A job is claimed atomically with `find_one_and_update`, so each one runs
+    in a single process even with several workers. A claim is a lease: if the
+    process dies mid-job, the job becomes claimable again once `lease_seconds`
+    have passed; while the handler runs, the lease is renewed every third of
+    that. Failed jobs are retried with exponential backoff and jitter until
+    the type's `max_attempts` is reached, then kept with status `failed`.
+    Jobs that are done or failed for good lose their payload, which can hold
+    secrets such as a password reset link.
+    """
+
+    def __init__(self, collection, poll_seconds: float = 1.0, lease_seconds: float = 300,
+                 backoff_seconds: float = 5, backoff_max_seconds: float = 600):
+        self.collection = collection
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.worker_id = uuid.uuid4().hex[:12]
+
+        self._types: Dict[str, _JobType] = {}
+        self._tasks: set = set()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+
+    def register(self, job_type: str, handler: Callable[..., Awaitable], concurrency: int = 1,
+                 max_attempts: int = 5):
+        """`handler(**payload)` runs at most `concurrency` at a time in this process."""
+        self._types[job_type] = _JobType(handler, concurrency, max_attempts)
+
+    async def enqueue(self, job_type: str, payload: dict, delay_seconds: float = 0) -> str:
+        if job_type not in self._types:
+            raise ValueError(f"Unknown job type {job_type!r}")
+        now = datetime.now(timezone.utc)
+        result = await self.collection.insert_one({
+            "type": job_type,
+            "payload": payload,
+            "status": "pending",
+            "attempts": 0,
+            "run_at": now + timedelta(seconds=delay_seconds),
+            "created_at": now,
+        })
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return str(result.inserted_id)
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="job-queue")
+
+    async def stop(self, timeout: float = 10):
+        """Stops claiming jobs, gives running ones `timeout` seconds, then hands the rest back."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                claimed = await self._claim_available()
+            except PyMongoError as exc:
+                logger.warning(f"Job queue cannot reach MongoDB: {exc}")
+                claimed = 0
+            if claimed:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim_available(self) -> int:
+        claimed = 0
+        for job_type, spec in self._types.items():
+            while spec.running < spec.concurrency and not self._stopping:
+                job = await self._claim(job_type)
+                if job is None:
+                    break
+                spec.running += 1
+                task = asyncio.create_task(self._execute(spec, job))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                claimed += 1
+        return claimed
+
+    async def _claim(self, job_type: str) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        return await self.collection.find_one_and_update(
+            {
+                "type": job_type,
+                "$or": [
+                    {"status": "pending", "run_at": {"$lte": now}},
+                    # Lease ran out: the worker that claimed it is gone.
+                    {"status": "running", "lease_until": {"$lt": now}},
+                ],
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "worker": self.worker_id,
+                    "started_at": now,
+                    "lease_until": now + timedelta(seconds=self.lease_seconds),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("run_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_max_seconds, self.backoff_seconds * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _renew_lease(self, job: dict):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                result = await self.collection.update_one(
+                    {"_id": job["_id"], "worker": self.worker_id, "status": "running"},
+                    {"$set": {"lease_until": datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)}},
+                )
+            except PyMongoError as exc:
+                logger.warning(f"Could not renew the lease of job {job['_id']}: {exc}")
+                continue
+            if not result.matched_count:
+                logger.warning(f"Job {job['type']} {job['_id']} lost its lease to another worker")
+                return
+
+    async def _execute(self, spec: _JobType, job: dict):
+        renewal = asyncio.create_task(self._renew_lease(job))
+        try:
+            await spec.handler(**job["payload"])
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back without counting the attempt.
+            await self._update(job, {"$set": {"status": "pending", "run_at": datetime.now(timezone.utc)},
+                                     "$inc": {"attempts": -1}})
+            raise
+        except Exception as exc:
+            await self._fail(spec, job, exc)
+        else:
+            self.completed += 1
+            await self._update(job, {"$set": {"status": "done", "finished_at": datetime.now(timezone.utc)},
+                                     "$unset": {"lease_until": "", "error": "", "payload": ""}})
+        finally:
+            renewal.cancel()
+            spec.running -= 1
+            self._wakeup.set()
+
+    async def _fail(self, spec: _JobType, job: dict, exc: Exception):
+        now = datetime.now(timezone.utc)
+        error = "".join(traceback.format_exception_only(type(exc), exc)).strip()
+        if job["attempts"] >= spec.max_attempts:
+            self.failed += 1
+            logger.error(f"Job {job['type']} {job['_id']} failed after {job['attempts']} attempts: {error}")
+            await self._update(job, {"$set": {"status": "failed", "error": error, "finished_at": now},
+                                     "$unset": {"lease_until": "", "payload": ""}})
+            return
+
+        self.retried += 1
+        delay = self._backoff(job["attempts"])
+        logger.warning(f"Job {job['type']} {job['_id']} attempt {job['attempts']} failed, retrying in {delay:.0f}s: {error}")
+        await self._update(job, {"$set": {"status": "pending", "error": error, "run_at": now + timedelta(seconds=delay)},
+                                 "$unset": {"lease_until": ""}})
+
+    async def _update(self, job: dict, update: dict):
+        try:
+            # Only if we still hold the lease; otherwise another worker owns the job now.
+            await self.collection.update_one({"_id": job["_id"], "worker": self.worker_id, "status": "running"}, update)
+        except PyMongoError as exc:
+            logger.warning(f"Could not record the outcome of job {job['_id']}: {exc}")
+
+    def stats(self) -> dict:
+        return {
+            "running": {job_type: spec.running for job_type, spec in self._types.items()},
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+
+job_queue = JobQueue(
+    job_collection,
+    poll_seconds=conf["job_poll_seconds"],
+    lease_seconds=conf["job_lease_seconds"],
+    backoff_seconds=conf["job_backoff_seconds"],
+    backoff_max_seconds=conf["job_backoff_max_seconds"],
+)
@@ -1,6 +1,9 @@
+from typing import Optional
 from pydantic import BaseModel
 
 class ChangePasswordRequest(BaseModel):
     old_password: str
     new_password: str
     confirm_new_password: str
+    # The caller's own refresh token; it stays valid while every other session is revoked.
+    refresh_token: Optional[str] = None
@@ -0,0 +1,190 @@
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from config.config import conf
+from internal.database.database import db
+from internal.utils.logger import logger
+
+revocation_collection = db.token_revocations
+
+
+class TokenCache:
+    """
+    In-process cache of access tokens that already passed the database check.
+
+    An entry never outlives the token's own expiry, and is additionally capped
+    at `max_ttl` seconds so a missed revocation cannot be trusted forever.
+
+    Every revocation bumps `generation`. Callers read it before the database
+    lookup and pass it to `put`, which then skips tokens whose lookup a
+    revocation may have raced with.
+    """
+
+    def __init__(self, max_entries: int = 10_000, max_ttl: float = 300):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._by_user: dict = {}
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[dict]:
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, user = entry
+        if expires_at <= time.time():
+            self._drop(token)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return user
+
+    def put(self, token: str, user: dict, expires_at: float, generation: Optional[int] = None):
+        if self.max_entries <= 0:
+            return
+        if generation is not None and generation != self.generation:
+            return
+        expires_at = min(expires_at, time.time() + self.max_ttl)
+        self._entries[token] = (expires_at, user)
+        self._entries.move_to_end(token)
+        self._by_user.setdefault(user["user_id"], set()).add(token)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._by_user.get(entry[1]["user_id"])
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._by_user[entry[1]["user_id"]]
+
+    def revoke(self, token: str):
+        self.generation += 1
+        self._drop(token)
+
+    def revoke_user(self, user_id: str, except_token: Optional[str] = None):
+        self.generation += 1
+        for token in list(self._by_user.get(user_id, ())):
+            if token != except_token:
+                self._drop(token)
+
+    def apply(self, revocation: dict):
+        if revocation.get("token"):
+            self.revoke(revocation["token"])
+        if revocation.get("user_id"):
+            self.revoke_user(revocation["user_id"], revocation.get("except_token"))
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+        self._by_user.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+token_cache = TokenCache(
+    max_entries=conf["auth_token_cache_max_entries"],
+    max_ttl=conf["auth_token_cache_max_ttl_seconds"],
+)
+
+
+async def publish_revocation(token: Optional[str] = None, user_id: Optional[str] = None,
+                             except_token: Optional[str] = None):
+    """
+    Evicts tokens from this worker's cache and tells every other worker to do
+    the same through the `token_revocations` collection. Callers must already
+    have deactivated the tokens in the database.
+    """
+    revocation = {"token": token, "user_id": user_id, "except_token": except_token}
+    token_cache.apply(revocation)
+
+    now = datetime.now(timezone.utc)
+    try:
+        await revocation_collection.insert_one({
+            **revocation,
+            "created_at": now,
+            # Nothing older than the cache TTL can still be cached anywhere.
+            "expires_at": now + timedelta(seconds=conf["auth_token_cache_max_ttl_seconds"] + 60),
+        })
+    except PyMongoError as exc:
+        logger.warning(f"Could not publish token revocation: {exc}")
+
+
+class RevocationListener:
+    """
+    Applies revocations published by other workers to the local cache. Uses a
+    MongoDB change stream when the deployment supports one (replica set or
+    sharded cluster) and falls back to polling on a standalone server.
+    """
+
+    def __init__(self, collection, poll_seconds: float = 2.0):
+        self.collection = collection
+        self.poll_seconds = poll_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None and conf["auth_token_cache_enabled"] and not conf["auth_stateless"]:
+            self._task = asyncio.create_task(self._run(), name="token-revocations")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        try:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+        except PyMongoError as exc:
+            logger.warning(f"Could not create token revocation TTL index: {exc}")
+
+        while True:
+            try:
+                await self._watch()
+            except OperationFailure as exc:
+                logger.info(f"Change streams unavailable ({exc.code}), polling token revocations instead")
+                await self._poll()
+            except PyMongoError as exc:
+                logger.warning(f"Token revocation listener lost its connection: {exc}")
+                # Entries may have been revoked while we were away.
+                token_cache.clear()
+                await asyncio.sleep(self.poll_seconds)
+
+    async def _watch(self):
+        async with self.collection.watch([{"$match": {"operationType": "insert"}}]) as stream:
+            async for change in stream:
+                token_cache.apply(change["fullDocument"])
+
+    async def _poll(self):
+        last_seen = datetime.now(timezone.utc)
+        # Worker clocks are not perfectly in sync; revocations are idempotent,
+        # so re-reading a short overlap is cheaper than missing one.
+        overlap = timedelta(seconds=5)
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                cursor = self.collection.find({"created_at": {"$gt": last_seen - overlap}})
+                async for revocation in cursor:
+                    token_cache.apply(revocation)
+                    last_seen = max(last_seen, revocation["created_at"].replace(tzinfo=timezone.utc))
+            except PyMongoError as exc:
+                logger.warning(f"Polling token revocations failed: {exc}")
+
+
+revocation_listener = RevocationListener(revocation_collection, poll_seconds=conf["auth_revocation_poll_seconds"])
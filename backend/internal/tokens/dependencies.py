@@ -4,7 +4,8 @@ import jwt
 from jwt import ExpiredSignatureError, InvalidTokenError
 from config.config import conf
 from internal.database.database import access_token_collection
-from datetime import datetime
+from internal.tokens.cache import token_cache
+from datetime import datetime, timezone
 from typing import Optional
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
@@ -32,6 +33,21 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Optional[dict
             detail="Invalid token",
         )
 
+    user = {
+        "email": email,
+        "user_id": user_id
+    }
+
+    if conf["auth_stateless"]:
+        return user
+
+    if conf["auth_token_cache_enabled"]:
+        cached_user = token_cache.get(token)
+        if cached_user is not None:
+            return cached_user
+    # A revocation landing during the lookup below must keep the token out of the cache.
+    generation = token_cache.generation
+
     access_token_db = await access_token_collection.find_one({"token": token})
 
     if not access_token_db:
@@ -59,7 +75,12 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Optional[dict
             detail="Inactive token",
         )
 
-    return {
-        "email": email,
-        "user_id": user_id
-    }
+    if conf["auth_token_cache_enabled"]:
+        token_cache.put(
+            token,
+            user,
+            expires_at=min(payload["exp"], expires_at.replace(tzinfo=timezone.utc).timestamp()),
+            generation=generation,
+        )
+
+    return user
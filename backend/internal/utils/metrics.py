@@ -0,0 +1,272 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from pymongo import monitoring
+
+# Exposed through /metrics; with several worker processes set
+# PROMETHEUS_MULTIPROC_DIR so every worker's samples are aggregated.
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time from request start until the last response byte is sent",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests currently being handled",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+REQUEST_BODY_BYTES = Histogram(
+    "http_request_body_bytes",
+    "Declared Content-Length of request bodies",
+    ["method", "route"],
+    buckets=(1_000, 10_000, 100_000, 500_000, 1_000_000, 5_000_000, 10_000_000, 20_000_000, 50_000_000),
+)
+STAGE_SECONDS = Histogram(
+    "stage_duration_seconds",
+    "Time spent in a hot-path stage (decode, forward, gridfs_upload, bcrypt_verify, ...)",
+    ["stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 10),
+)
+DETECT_TTA_TOTAL = Counter(
+    "detect_tta_total",
+    "Detect requests that asked for TTA, by what happened (applied, not_needed, skipped_load, budget_exceeded)",
+    ["outcome"],
+)
+DETECT_ADMISSION_TOTAL = Counter(
+    "detect_admission_total",
+    "Images sent to detection, by admission decision (admitted, degraded, rejected_wait, rejected_in_flight)",
+    ["decision"],
+)
+MONGO_COMMAND_SECONDS = Histogram(
+    "mongo_command_duration_seconds",
+    "MongoDB command round trips as seen by the driver",
+    ["command", "collection"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "mongo_command_failures_total",
+    "MongoDB commands that failed",
+    ["command", "collection"],
+)
+MONGO_POOL_MAX_SIZE = Gauge(
+    "mongo_pool_max_size",
+    "maxPoolSize of the driver's connection pool to each server",
+    ["address"],
+    multiprocess_mode="livesum",
+)
+MONGO_POOL_CONNECTIONS = Gauge(
+    "mongo_pool_connections",
+    "Open connections in the pool to each server",
+    ["address"],
+    multiprocess_mode="livesum",
+)
+MONGO_POOL_CHECKED_OUT = Gauge(
+    "mongo_pool_checked_out",
+    "Pooled connections currently in use by an operation",
+    ["address"],
+    multiprocess_mode="livesum",
+)
+MONGO_POOL_WAIT_SECONDS = Histogram(
+    "mongo_pool_wait_seconds",
+    "Time an operation waited to check a connection out of the pool",
+    ["address"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+MONGO_POOL_CHECKOUT_FAILURES = Counter(
+    "mongo_pool_checkout_failures_total",
+    "Connection checkouts that failed (timeout, connectionError, poolClosed)",
+    ["address", "reason"],
+)
+
+
+_captured_stages: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("captured_stages", default=None)
+
+
+def observe_stage(stage: str, seconds: float):
+    captured = _captured_stages.get()
+    if captured is not None:
+        captured.append((stage, seconds))
+    else:
+        STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+@contextmanager
+def capture_stages():
+    """
+    Collects the stages timed in the enclosed block into a list of
+    `(stage, seconds)` instead of observing them. For processes nobody
+    scrapes (model server workers): they hand the list back to the API
+    worker, which observes it with `observe_stage`.
+    """
+    captured = []
+    token = _captured_stages.set(captured)
+    try:
+        yield captured
+    finally:
+        _captured_stages.reset(token)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Times the enclosed block into `stage_duration_seconds{stage=...}`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def timed(stage: str, fn, *args, **kwargs):
+    """Calls `fn` and times it; handy inside `asyncio.to_thread`."""
+    with stage_timer(stage):
+        return fn(*args, **kwargs)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo command listener feeding `mongo_command_duration_seconds`."""
+
+    # Commands whose first field is not a collection name.
+    _NO_COLLECTION = {"hello", "ismaster", "isMaster", "ping", "endSessions", "saslStart", "saslContinue", "buildInfo"}
+
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        if event.command_name in self._NO_COLLECTION:
+            return
+        collection = event.command.get(event.command_name)
+        # getMore carries a cursor id; its collection is in a separate field.
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        self._collections[(event.connection_id, event.request_id)] = str(collection) if isinstance(collection, str) else "-"
+
+    def _labels(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), None)
+        return event.command_name, collection or "-"
+
+    def succeeded(self, event):
+        if event.command_name in self._NO_COLLECTION:
+            return
+        MONGO_COMMAND_SECONDS.labels(*self._labels(event)).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        if event.command_name in self._NO_COLLECTION:
+            return
+        labels = self._labels(event)
+        MONGO_COMMAND_SECONDS.labels(*labels).observe(event.duration_micros / 1e6)
+        MONGO_COMMAND_FAILURES.labels(*labels).inc()
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    pymongo pool listener: checked out over max size is the utilization to
+    size `MONGO_MAX_POOL_SIZE` against, and a growing checkout wait means
+    operations are queueing for connections.
+    """
+
+    @staticmethod
+    def _address(event) -> str:
+        host, port = event.address
+        return f"{host}:{port}"
+
+    def pool_created(self, event):
+        MONGO_POOL_MAX_SIZE.labels(self._address(event)).set(event.options.get("maxPoolSize", 100))
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        MONGO_POOL_MAX_SIZE.labels(self._address(event)).set(0)
+
+    def connection_created(self, event):
+        MONGO_POOL_CONNECTIONS.labels(self._address(event)).inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        MONGO_POOL_CONNECTIONS.labels(self._address(event)).dec()
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        MONGO_POOL_CHECKOUT_FAILURES.labels(self._address(event), str(event.reason)).inc()
+
+    def connection_checked_out(self, event):
+        address = self._address(event)
+        MONGO_POOL_CHECKED_OUT.labels(address).inc()
+        if event.duration is not None:
+            MONGO_POOL_WAIT_SECONDS.labels(address).observe(event.duration)
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CHECKED_OUT.labels(self._address(event)).dec()
+
+
+def render_metrics():
+    """Returns `(body, content_type)` in the Prometheus text format."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware, so streamed responses are timed until their last
+    chunk rather than until the headers go out. The route label is the
+    matched route template (`/api/reports/pdf/{report_id}`), never the raw
+    path, to keep label cardinality bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        started = time.perf_counter()
+        status = "500"
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        # The route is only known once routing ran, so in-flight is per method.
+        in_flight = REQUESTS_IN_FLIGHT.labels(method)
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            REQUEST_LATENCY.labels(method, route, status).observe(time.perf_counter() - started)
+            length = dict(scope.get("headers") or []).get(b"content-length")
+            if length and length.isdigit():
+                REQUEST_BODY_BYTES.labels(method, route).observe(int(length))
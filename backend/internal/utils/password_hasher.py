@@ -0,0 +1,59 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+from fastapi import HTTPException
+
+from internal.utils.metrics import stage_timer
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a small dedicated thread pool instead of the event loop.
+
+    bcrypt releases the GIL, so other requests keep being served while a hash
+    is computed. At most `max_pending` operations may be queued or running;
+    beyond that callers get a 503 instead of piling up behind the pool.
+    """
+
+    def __init__(self, rounds: int = 12, max_workers: int = 2, max_pending: int = 64):
+        self.rounds = rounds
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self._pending = 0
+
+    async def _run(self, fn, *args):
+        if self._pending >= self.max_pending:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many password operations in progress, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._pending -= 1
+
+    def _hash(self, password: str) -> str:
+        with stage_timer("bcrypt_hash"):
+            return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(self.rounds)).decode("utf-8")
+
+    @staticmethod
+    def _verify(password: str, hashed_password: str) -> bool:
+        with stage_timer("bcrypt_verify"):
+            return bcrypt.checkpw(password.encode("utf-8"), hashed_password.encode("utf-8"))
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self._hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(self._verify, password, hashed_password)
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """True when the stored hash was made with a different cost factor than the configured one."""
+        try:
+            return int(hashed_password.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
@@ -0,0 +1,12 @@
+import os
+
+from config.config import conf
+from internal.utils.password_hasher import PasswordHasher
+
+# The hasher itself takes all its settings as arguments, so offline tools can
+# import it from internal.utils.password_hasher without the app config.
+password_hasher = PasswordHasher(
+    rounds=conf["bcrypt_rounds"],
+    max_workers=conf["bcrypt_max_workers"] or min(4, os.cpu_count() or 1),
+    max_pending=conf["bcrypt_max_pending"],
+)
@@ -1,6 +1,7 @@
-def success_response(data=None, message="Operation successful"):
+def success_response(data=None, message="Operation successful", **extra):
     return {
         "success": True,
         "message": message,
-        "data": data
+        "data": data,
+        **extra
     }
\ No newline at end of file
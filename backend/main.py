@@ -1,11 +1,17 @@
+import asyncio
+import time
+
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from routes.detection import router as detection_router
+from routes.detection import router as detection_router, inference_service, prediction_cache, model_loader
 from routes import report_controller
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 from fastapi import FastAPI, Request
+from contextlib import asynccontextmanager
 import traceback
 
 from internal.exception.handler import (
@@ -18,8 +24,65 @@ from internal.exception.base_exception import BaseException
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from routes.auth_controller import router as auth_router
+from routes.health import router as health_router
+from routes.metrics import router as metrics_router
+from internal.utils.metrics import MetricsMiddleware
+from internal.utils.logger import logger
+from internal.tokens.cache import revocation_listener
+from internal.jobs.queue import job_queue
+from internal.email.mailer import smtp_pool
+from internal.database import database
+from internal.database.indexes import bootstrap as bootstrap_indexes
+from config.config import conf
+
+logger.info(f"App modules imported in {time.perf_counter() - _import_started:.2f}s")
+
+
+async def bootstrap_database():
+    if conf["mongo_ensure_indexes"]:
+        await bootstrap_indexes(check=conf["mongo_check_query_plans"])
+    await prediction_cache.ensure_indexes()
+
+
+async def bootstrap_database_in_background():
+    try:
+        await bootstrap_database()
+    except Exception:
+        logger.exception("Index bootstrap failed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup_started = time.perf_counter()
+    # The model loads in the background so auth and report routes serve right away.
+    model_loader.start()
+    database.connect()
+    bootstrap_task = None
+    if conf["mongo_check_query_plans"]:
+        # Refusing to start on a COLLSCAN means waiting for the indexes.
+        await bootstrap_database()
+    else:
+        # With MongoDB unreachable this would hold up startup for the whole server selection timeout.
+        bootstrap_task = asyncio.create_task(bootstrap_database_in_background())
+    await inference_service.start()
+    revocation_listener.start()
+    job_queue.start()
+    logger.info(f"Startup completed in {time.perf_counter() - startup_started:.2f}s")
+    yield
+    if bootstrap_task is not None:
+        bootstrap_task.cancel()
+        await asyncio.gather(bootstrap_task, return_exceptions=True)
+    await job_queue.stop()
+    await smtp_pool.close()
+    await revocation_listener.stop()
+    await inference_service.stop()
+    await model_loader.stop()
+    database.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
-app = FastAPI()
+app.add_middleware(MetricsMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -47,6 +110,8 @@ app.add_exception_handler(BaseException, base_exception_handler)
 app.include_router(auth_router)
 app.include_router(detection_router)
 app.include_router(report_controller.router)
+app.include_router(health_router)
+app.include_router(metrics_router)
 
 
 @app.get("/")
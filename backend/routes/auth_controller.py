@@ -9,10 +9,11 @@ from internal.models.update_profile_request import UpdateProfileRequest
 from internal.email.verification_code import generate_code, save_verification_code, verify_code
 from internal.email.mailer import send_email
 from internal.tokens.tokens import create_access_token, create_refresh_token
-from internal.tokens.dependencies import get_current_user
+from internal.tokens.dependencies import get_current_user, oauth2_scheme
+from internal.tokens.cache import publish_revocation
 from internal.utils.response import success_response
+from internal.utils.passwords import password_hasher
 from config.config import conf
-import bcrypt
 import uuid
 from datetime import datetime, timedelta, timezone
 import re
@@ -25,7 +26,7 @@ async def signup(user: UserSignUp):
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    hashed_password = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    hashed_password = await password_hasher.hash(user.password)
     user_id = str(uuid.uuid4())
 
     user_data = {
@@ -50,9 +51,14 @@ async def signup(user: UserSignUp):
 @router.post("/login")
 async def login(user: UserLogin):
     existing_user = await get_user_by_email(user.email)
-    if not existing_user or not bcrypt.checkpw(user.password.encode('utf-8'), existing_user["hashed_password"].encode('utf-8')):
+    if not existing_user or not await password_hasher.verify(user.password, existing_user["hashed_password"]):
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
+    if password_hasher.needs_rehash(existing_user["hashed_password"]):
+        # The plaintext is only available here, so upgrade (or downgrade) the stored cost on login.
+        hashed_password = await password_hasher.hash(user.password)
+        await user_collection.update_one({"email": user.email}, {"$set": {"hashed_password": hashed_password}})
+
     access_token = create_access_token({
     "sub": user.email,
     "user_id": existing_user["id"],
@@ -113,8 +119,12 @@ async def reset_password(email: EmailStr = Body(...), token: str = Body(...), ne
     if not await verify_code(email, token):
         raise HTTPException(status_code=400, detail="Invalid or expired token.")
 
-    hashed_pw = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    hashed_pw = await password_hasher.hash(new_password)
     await user_collection.update_one({"email": email}, {"$set": {"hashed_password": hashed_pw}})
+
+    user = await get_user_by_email(email)
+    if user:
+        await revoke_user_sessions(user["id"])
     
     return success_response(message="Password has been reset successfully.")
 
@@ -259,19 +269,22 @@ def is_valid_password(password: str) -> bool:
 @router.post("/change-password")
 async def change_password(
     data: ChangePasswordRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    token: str = Depends(oauth2_scheme)
 ):
     user = await user_collection.find_one({"id": current_user["user_id"]})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    if not bcrypt.checkpw(data.old_password.encode(), user["hashed_password"].encode()):
+    if not await password_hasher.verify(data.old_password, user["hashed_password"]):
         raise HTTPException(status_code=400, detail="Old password is incorrect")
 
     if data.new_password != data.confirm_new_password:
         raise HTTPException(status_code=400, detail="New passwords do not match")
     
-    if bcrypt.checkpw(data.new_password.encode(), user["hashed_password"].encode()):
+    # The old password was just verified and bcrypt only looks at the first 72 bytes,
+    # so comparing those is equivalent to hashing the new password again.
+    if data.new_password.encode()[:72] == data.old_password.encode()[:72]:
         raise HTTPException(status_code=400, detail="New password must be different from old password")
 
     if not is_valid_password(data.new_password):
@@ -280,11 +293,12 @@ async def change_password(
             detail="Password must be at least 8 characters long, include an uppercase, lowercase, number and special character"
         )
 
-    hashed_new_pw = bcrypt.hashpw(data.new_password.encode(), bcrypt.gensalt()).decode()
+    hashed_new_pw = await password_hasher.hash(data.new_password)
     await user_collection.update_one(
         {"id": current_user["user_id"]},
         {"$set": {"hashed_password": hashed_new_pw}}
     )
+    await revoke_user_sessions(current_user["user_id"], except_token=token, except_refresh_token=data.refresh_token)
 
     return success_response(message="Password changed successfully")
 
@@ -302,5 +316,25 @@ async def logout(
         {"token": refresh_token},
         {"$set": {"is_active": False}}
     )
+    await publish_revocation(token=access_token)
 
     return success_response(message="Successfully logged out.")
+
+
+async def revoke_user_sessions(user_id: str, except_token: str = None, except_refresh_token: str = None):
+    """
+    Deactivates every access and refresh token of the user (but `except_token` /
+    `except_refresh_token`, the current session) and evicts the access tokens from
+    all workers' caches. Refresh tokens are checked in the database on every use.
+    """
+    query = {"user_id": user_id, "is_active": True}
+    if except_token:
+        query["token"] = {"$ne": except_token}
+    await access_token_collection.update_many(query, {"$set": {"is_active": False}})
+
+    refresh_query = {"user_id": user_id, "is_active": True}
+    if except_refresh_token:
+        refresh_query["token"] = {"$ne": except_refresh_token}
+    await refresh_token_collection.update_many(refresh_query, {"$set": {"is_active": False}})
+
+    await publish_revocation(user_id=user_id, except_token=except_token)
@@ -1,17 +1,97 @@
-from fastapi import APIRouter, UploadFile, File
-from ultralytics import YOLO
-import shutil
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from detection.inference.batcher import BatchInferenceService
+from detection.inference.admission import AdmissionController
+from detection.inference.decode import decode_image, ImageDecodeError, ImageTooLargeError
+from detection.inference.cache import PredictionCache, image_digest, make_cache_key
+from detection.inference.backends import load_backend
+from detection.inference.model_server import ModelServerClient
+from detection.inference.loader import ModelLoader, ModelNotReadyError
+from detection.inference.overlay import normalized_boxes, render_overlay
+from detection.inference import tta
+from internal.database.database import db
+from internal.utils.response import success_response
+from internal.utils.logger import logger
+from internal.utils.metrics import DETECT_TTA_TOTAL, stage_timer, timed
+from config.config import conf
 from pathlib import Path
+from typing import List, Literal, Optional
+import asyncio
+import base64
+import json
+import time
 import uuid
 import os
+import numpy as np
 
 router = APIRouter()
 
-# Geçici klasörü oluştur
-os.makedirs("temp", exist_ok=True)
+# Geçici klasörü yalnızca debug modunda oluştur
+if conf["detect_save_uploads"]:
+    os.makedirs("temp", exist_ok=True)
+
+def create_model():
+    """
+    Model sunucusu tanımlıysa modeli ona bırakır, değilse INFERENCE_BACKEND ile seçilen modeli bu süreçte yükler.
+    Uygulama açıldıktan sonra arka plandaki bir thread'de çalışır.
+    """
+    if conf["model_server_address"]:
+        client = ModelServerClient(
+            conf["model_server_address"],
+            authkey=conf["model_server_authkey"].encode(),
+            timeout=conf["model_server_timeout"],
+        )
+        info = client.wait_until_ready(conf["model_server_timeout"])
+        logger.info(f"Model server ready: {info['workers']} worker(s), version {info['version']}")
+        return client
+    return load_backend(conf["inference_backend"])
+
+
+# Model import sırasında değil, uygulama açıldıktan sonra arka planda yüklenir
+model_loader = ModelLoader(create_model, retry_seconds=conf["model_load_retry_seconds"])
+
+
+async def get_model():
+    """Model hazır olana kadar en fazla MODEL_READY_TIMEOUT saniye bekler."""
+    try:
+        return await model_loader.wait_ready(conf["model_ready_timeout"])
+    except ModelNotReadyError as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "5"})
+
+
+def model_version(model):
+    return conf["model_version"] or model.version
 
-# Eğitimli YOLO modelini yükle
-model = YOLO("models/best.pt")
+
+def predict_batch(images, **options):
+    return model_loader.model.predict(images, **options)
+
+
+# İstekleri toplayıp batch halinde modele gönderen servis.
+# Her görüntü için [x1, y1, x2, y2, conf, cls] satırlarından oluşan bir dizi döner.
+inference_service = BatchInferenceService(
+    predict_batch,
+    max_batch_size=conf["detect_max_batch_size"],
+    max_wait_ms=conf["detect_max_wait_ms"],
+    max_queue_size=conf["detect_max_queue_size"],
+)
+
+# Model önündeki tahmini bekleme süresine göre istekleri küçük boyutta çalıştırır ya da 429/503 ile geri çevirir
+admission = AdmissionController(
+    inference_service,
+    degrade_wait_ms=conf["detect_degrade_wait_ms"],
+    reject_wait_ms=conf["detect_reject_wait_ms"],
+    max_in_flight=conf["detect_max_in_flight"],
+    degrade_imgsz=conf["detect_degrade_imgsz"],
+    recover_wait_ms=conf["detect_recover_wait_ms"],
+) if conf["detect_admission_enabled"] else None
+
+# Aynı görüntü tekrar gönderildiğinde modeli çalıştırmamak için sonuç önbelleği
+prediction_cache = PredictionCache(
+    max_entries=conf["prediction_cache_max_entries"],
+    ttl_seconds=conf["prediction_cache_ttl_seconds"],
+    collection=db.prediction_cache if conf["prediction_cache_mongo"] else None,
+)
 
 # Sınıf etiketlerinin detaylı açıklamaları
 CLASS_DETAILS = {
@@ -52,29 +132,335 @@ CLASS_DETAILS = {
     }
 }
 
+# mode=auto'da düşük güvenle bulunduklarında TTA ile ikinci kez bakılan sınıflar (MEL, AKIEC)
+HIGH_RISK_CLASSES = {label for label, details in CLASS_DETAILS.items() if details["risk_level"] == "High risk"}
+
+DetectMode = Literal["fast", "auto", "accurate"]
+MODE_DESCRIPTION = (
+    "fast: tek geçiş; accurate: çoklu ölçek ve çevirmeli TTA; "
+    "auto: yalnızca sınırda yüksek riskli sonuçlarda TTA. TTA gecikme bütçesini aşacaksa tek geçiş sonucu döner."
+)
+
 @router.post("/detect")
-async def detect_lesion(file: UploadFile = File(...)):
+async def detect_lesion(
+    file: UploadFile = File(...),
+    overlay: bool = Query(False, description="Kutuların çizildiği JPEG görüntüyü de döndür"),
+    mode: DetectMode = Query("fast", description=MODE_DESCRIPTION),
+):
     """
     Uploaded image üzerinden cilt lezyonlarını tespit eder.
     YOLOv8 modelinden çıkan kutular ve sınıf bilgileri ile detaylı analiz döner.
     """
-    # Geçici dosya olarak kaydet
-    temp_path = Path(f"temp/{uuid.uuid4()}.jpg")
-    with open(temp_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    data = await file.read()
+    digest, lookups = image_digest(data), {}
+    if await needs_model(digest, mode, lookups):
+        imgsz = admit()
+        try:
+            return await run_admitted(data, imgsz, overlay, mode, digest, lookups)
+        finally:
+            release()
+    return await run_detection(data, conf["detect_imgsz"], overlay, mode, digest, lookups)
+
+
+@router.post("/detect/batch")
+async def detect_lesion_batch(
+    files: List[UploadFile] = File(...),
+    overlay: bool = Query(False),
+    mode: DetectMode = Query("fast", description=MODE_DESCRIPTION),
+):
+    """
+    Tek bir multipart istekte birden fazla görüntüyü analiz eder.
+    Görüntüler aynı anda kuyruğa girer ve batch servisi tarafından gerçek batch'ler halinde modele verilir.
+    Her görüntünün sonucu hazır olur olmaz NDJSON satırı olarak akıtılır.
+    """
+    if len(files) > conf["detect_batch_max_files"]:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {conf['detect_batch_max_files']} images can be sent in one batch",
+        )
+
+    # Dosyalar yanıt akışı başlamadan okunur, istek kapandıktan sonra erişilemezler
+    uploads = [(index, file.filename, await file.read()) for index, file in enumerate(files)]
+    digests = [image_digest(data) for _, _, data in uploads]
+    lookups = {}
+    # Önbellekte olmayan görüntülerin hepsi birlikte kabul edilir ya da reddedilir
+    uncached = [await needs_model(digest, mode, lookups) for digest in digests]
+    imgsz = admit(sum(uncached)) if any(uncached) else conf["detect_imgsz"]
+
+    async def detect_one(index, filename, data, digest, admitted):
+        try:
+            if admitted:
+                result = await run_admitted(data, imgsz, overlay, mode, digest, lookups)
+            else:
+                result = await run_detection(data, conf["detect_imgsz"], overlay, mode, digest, lookups)
+        except HTTPException as exc:
+            result = {"error": {"status_code": exc.status_code, "message": exc.detail}}
+        except Exception:
+            logger.exception(f"Batch detection failed for {filename}")
+            result = {"error": {"status_code": 500, "message": "Internal Server Error"}}
+        return {"index": index, "filename": filename, **result}
+
+    tasks = [
+        asyncio.create_task(detect_one(*upload, digest, admitted))
+        for upload, digest, admitted in zip(uploads, digests, uncached)
+    ]
+    for task, admitted in zip(tasks, uncached):
+        if admitted:
+            # Başlamadan iptal edilen işler de kabul sayacından düşülsün diye finally yerine callback
+            task.add_done_callback(lambda _: release())
+
+    async def stream_results():
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # İstemci bağlantıyı koparırsa kalan işleri iptal et
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+async def needs_model(digest: str, mode: str, lookups: dict) -> bool:
+    """
+    Sonucu önbellekte olmayan görüntüler için True döner; yalnızca bunlar kabul kontrolünden geçer
+    ve kabul sayacında yer tutar. Önbellekteki sonuçlar yük altında da küçültülmeden ve reddedilmeden döner.
+    Bakılan anahtarlar lookups'a yazılır, run_detection önbelleğe ikinci kez sormaz.
+    """
+    if admission is None:
+        return True
+    model = await get_model()
+    key = make_cache_key(digest, model_version(model), conf["detect_imgsz"])
+    lookups[key] = result, tier = await prediction_cache.peek(key)
+    if tier is None:
+        return True
+    if mode == "fast" or (mode == "auto" and not is_borderline(result["boxes"], model.names)):
+        return False
+    # TTA sonucu da önbellekte değilse ek geçişler modele gider
+    lookups[key + ":tta"] = _, tier = await prediction_cache.peek(key + ":tta")
+    return tier is None
+
+
+def admit(images: int = 1) -> int:
+    """Görüntüleri kabul eder ve çalıştırılacakları imgsz'yi döner; sunucu çok yüklüyse 429/503 fırlatır."""
+    if admission is None:
+        return conf["detect_imgsz"]
+    return admission.admit(conf["detect_imgsz"], images)
+
+
+def release(images: int = 1):
+    if admission is not None:
+        admission.release(images)
+
+
+async def run_admitted(data: bytes, imgsz: int, overlay: bool, mode: str, digest: str, lookups: dict):
+    if imgsz == conf["detect_imgsz"]:
+        return await run_detection(data, imgsz, overlay, mode, digest, lookups)
+    # Yük altında küçültülmüş boyutta çalışılır, TTA yapılmaz
+    response = await run_detection(data, imgsz, overlay, digest=digest, lookups=lookups)
+    response["degraded"] = {"imgsz": imgsz}
+    return response
+
+
+async def run_detection(data: bytes, imgsz: int, overlay: bool = False, mode: str = "fast",
+                        digest: Optional[str] = None, lookups: Optional[dict] = None):
+    """
+    Önbellekte yoksa görüntüyü çözüp batch servisi üzerinden modele verir.
+    overlay istenirse kutular çizilip JPEG olarak bir kez kodlanır ve aynı önbellek kaydına eklenir;
+    overlaysiz önbelleğe alınmış bir görüntü için model yeniden çalışmaz, overlay kayıtlı kutulardan çizilir.
+    mode fast değilse tek geçiş sonucu üzerine TTA uygulanabilir (bkz. run_tta).
+    digest ve lookups needs_model'den gelir: görüntü bir kez hash'lenir, bakılmış anahtarlar yeniden sorulmaz.
+    """
+    started = time.perf_counter()
+    model = await get_model()
+
+    async def run_model():
+        image = await load_image(data)
+        # Tahmin yap (batch servisi üzerinden)
+        boxes = await inference_service.submit(image, imgsz=imgsz)
+        if isinstance(image, str):
+            # Debug modunda model dosyayı kendisi okur, kutular orijinal boyuttadır
+            image = await asyncio.to_thread(decode_image, data, conf["detect_max_pixels"])
+        height, width = image.shape[:2]
+        result = {"boxes": boxes.tolist(), "size": [width, height]}
+        if overlay:
+            result["overlay"] = await encode_overlay(image, boxes, model.names)
+        return result
+
+    lookups = lookups or {}
+    key = make_cache_key(digest or image_digest(data), model_version(model), imgsz)
+    result, hit = await prediction_cache.get_or_compute(key, run_model, lookups.get(key))
+    result_key = key
+
+    tta_status = None
+    if mode == "accurate" or (mode == "auto" and is_borderline(result["boxes"], model.names)):
+        tta_result, tta_status = await run_tta(
+            data, imgsz, overlay, model, key + ":tta", result, started, lookups.get(key + ":tta")
+        )
+        if tta_result is not None:
+            result, hit = tta_result
+            result_key = key + ":tta"
+    elif mode == "auto":
+        tta_status = "not_needed"
+    if tta_status is not None:
+        DETECT_TTA_TOTAL.labels(tta_status).inc()
+    if overlay:
+        result = await with_overlay(result_key, result, data, model.names)
+
+    response = {
+        "predictions": build_predictions(result["boxes"], model.names, result["size"]),
+        "cache": "hit" if hit else "miss",
+    }
+    if tta_status is not None:
+        response["tta"] = {"status": tta_status, "passes": result.get("passes", 1)}
+    if overlay:
+        response["overlay"] = {"media_type": "image/jpeg", "data": result["overlay"]}
+    return response
+
+
+def is_borderline(boxes, class_names) -> bool:
+    """Yüksek riskli bir sınıf, TTA'ya değecek kadar düşük güvenle bulunduysa True döner."""
+    return any(
+        class_names[int(cls_id)] in HIGH_RISK_CLASSES and conf_score < conf["detect_tta_borderline_conf"]
+        for *_, conf_score, cls_id in boxes
+    )
+
+
+async def run_tta(data: bytes, imgsz: int, overlay: bool, model, key: str, single: dict, started: float,
+                  lookup: Optional[tuple] = None):
+    """
+    Tek geçiş sonucunu, görüntünün DETECT_TTA_SCALES boyutlarında ve DETECT_TTA_FLIPS
+    çevirmeleriyle elde edilen tahminlerle weighted box fusion ile birleştirir.
+
+    Aynı boyuttaki geçişler birlikte kuyruğa girer, batch servisi onları tek bir ileri
+    geçişte çalıştırır. İstek DETECT_TTA_BUDGET_MS içinde bitmeyecekse (sunucu yüklüyse ya
+    da geçişler zamanında dönmezse) TTA bırakılır ve tek geçiş sonucu kullanılır.
+    `((result, hit) ya da None, durum)` döner.
+    """
+    variants = tta.plan(imgsz, conf["detect_tta_scales"], conf["detect_tta_flips"])[1:]
+    if not variants:
+        return None, "not_needed"
+
+    remaining_ms = conf["detect_tta_budget_ms"] - (time.perf_counter() - started) * 1000
+    if (
+        inference_service.queue_depth() > conf["detect_tta_max_queue_depth"]
+        or inference_service.estimate_ms(tta.relative_cost(variants, imgsz)) > remaining_ms
+    ):
+        return None, "skipped_load"
+
+    async def run_passes():
+        # Büyük ölçekli geçişlerin anlamı olsun diye görüntü en büyük TTA boyutuna göre çözülür
+        target_size = max(v.imgsz for v in variants) if conf["detect_early_downscale"] else None
+        image = await decode_upload(data, target_size)
+        height, width = image.shape[:2]
+
+        tasks = [
+            asyncio.ensure_future(inference_service.submit(tta.apply_flip(image, variant.flip), imgsz=variant.imgsz))
+            for variant in variants
+        ]
+        timeout = max(0.0, conf["detect_tta_budget_ms"] / 1000 - (time.perf_counter() - started))
+        with stage_timer("tta"):
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise tta.TTABudgetExceeded()
+
+        # Tek geçiş kutuları farklı boyutta çözülmüş görüntüye göredir
+        single_boxes = np.asarray(single["boxes"], dtype=np.float32).reshape(-1, 6).copy()
+        single_width, single_height = single["size"]
+        single_boxes[:, [0, 2]] *= width / single_width
+        single_boxes[:, [1, 3]] *= height / single_height
+        box_sets = [single_boxes] + [
+            tta.unflip_boxes(task.result(), variant.flip, width, height) for variant, task in zip(variants, tasks)
+        ]
+        boxes = tta.weighted_boxes_fusion(
+            box_sets, conf["detect_tta_iou_threshold"], conf_threshold=conf["detect_conf_threshold"]
+        )
+
+        result = {"boxes": boxes.tolist(), "size": [width, height], "passes": len(box_sets)}
+        if overlay:
+            result["overlay"] = await encode_overlay(image, boxes, model.names)
+        return result
+
+    try:
+        return await prediction_cache.get_or_compute(key, run_passes, lookup), "applied"
+    except tta.TTABudgetExceeded:
+        return None, "budget_exceeded"
+
+
+async def encode_overlay(image, boxes, class_names) -> str:
+    jpeg = await asyncio.to_thread(
+        timed, "overlay", render_overlay, image, boxes, class_names,
+        conf["detect_overlay_max_side"], conf["detect_overlay_quality"], conf["detect_overlay_max_bytes"],
+    )
+    return base64.b64encode(jpeg).decode("ascii")
+
+
+async def with_overlay(key: str, result: dict, data: bytes, class_names) -> dict:
+    """
+    Önbellekteki sonuçta overlay yoksa kayıtlı kutulardan çizip aynı kayda ekler.
+    Kutular sonucun "size" boyutuna göredir, yeniden çözülen görüntüye ölçeklenir.
+    """
+    if "overlay" in result:
+        return result
+    image = await decode_upload(data, conf["detect_overlay_max_side"] if conf["detect_early_downscale"] else None)
+    height, width = image.shape[:2]
+    boxes = np.asarray(result["boxes"], dtype=np.float32).reshape(-1, 6).copy()
+    boxes[:, [0, 2]] *= width / result["size"][0]
+    boxes[:, [1, 3]] *= height / result["size"][1]
+    result = {**result, "overlay": await encode_overlay(image, boxes, class_names)}
+    await prediction_cache.set(key, result)
+    return result
+
+
+@router.get("/detect/stats")
+async def detection_stats():
+    """Batch servisi ve sonuç önbelleği metriklerini döner."""
+    model = model_loader.model
+    return success_response(data={
+        "model": model_loader.status(),
+        "model_version": model_version(model) if model else None,
+        "batching": inference_service.stats(),
+        "cache": prediction_cache.stats(),
+        "admission": admission.stats() if admission is not None else None,
+    })
+
+
+async def load_image(data: bytes):
+    """
+    Yüklenen görüntüyü diske yazmadan NumPy dizisine çözer.
+    DETECT_SAVE_UPLOADS açıksa eski davranış gibi temp/ altına kaydedip dosya yolunu döner.
+    """
+    if conf["detect_save_uploads"]:
+        temp_path = Path(f"temp/{uuid.uuid4()}.jpg")
+        temp_path.write_bytes(data)
+        # Model sunucusu dosya yolu değil, paylaşımlı bellekte piksel bekler
+        if not isinstance(model_loader.model, ModelServerClient):
+            return str(temp_path)
+
+    return await decode_upload(data, conf["detect_imgsz"] if conf["detect_early_downscale"] else None)
+
+
+async def decode_upload(data: bytes, target_size=None):
+    try:
+        return await asyncio.to_thread(timed, "decode", decode_image, data, conf["detect_max_pixels"], target_size)
+    except ImageTooLargeError as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
+    except ImageDecodeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
 
-    # Tahmin yap
-    results = model(temp_path, imgsz=640)
-    boxes = results[0].boxes
-    class_names = model.names
 
+def build_predictions(boxes, class_names, size):
     predictions = []
+    # Kutular görüntü boyutuna göre 0-1 aralığında döner, istemci hangi çözünürlükte gösterirse göstersin geçerlidir
+    box_coords = normalized_boxes(boxes, *size).round(4).tolist()
 
     # Sonuçları işle
-    for box in boxes:
-        cls_id = int(box.cls[0].item())
-        label = class_names[cls_id]
-        confidence = round(box.conf[0].item(), 2)
+    for (*_, conf_score, cls_id), (x1, y1, x2, y2) in zip(boxes, box_coords):
+        label = class_names[int(cls_id)]
+        confidence = round(float(conf_score), 2)
         details = CLASS_DETAILS.get(label, {})
 
         predictions.append({
@@ -82,7 +468,8 @@ async def detect_lesion(file: UploadFile = File(...)):
             "confidence": confidence,
             "full_label": details.get("full_label", label),
             "risk_level": details.get("risk_level", "Unknown"),
-            "advice": details.get("advice", "No advice available.")
+            "advice": details.get("advice", "No advice available."),
+            "box": {"x1": x1, "y1": y1, "x2": x2, "y2": y2},
         })
 
-    return {"predictions": predictions}
+    return predictions
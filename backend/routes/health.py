@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from routes.detection import model_loader
+
+router = APIRouter(prefix="/health", tags=["Health"])
+
+
+@router.get("/live")
+async def liveness():
+    return {"status": "alive", "model": model_loader.status()}
+
+
+@router.get("/ready")
+async def readiness():
+    # Auth and report routes don't need the model, so the API is ready as soon as it serves requests.
+    return {"status": "ready", "model": model_loader.status()}
+
+
+@router.get("/ready/detection")
+async def detection_readiness():
+    status_code = 200 if model_loader.ready else 503
+    return JSONResponse(
+        status_code=status_code,
+        content={"status": "ready" if model_loader.ready else "not_ready", "model": model_loader.status()},
+    )
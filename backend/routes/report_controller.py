@@ -1,11 +1,15 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Request, Query
 from datetime import datetime
+from typing import Literal, Optional
 from bson import ObjectId
-from internal.database.database import fs_bucket, report_collection
+from internal.database.database import report_collection
+from internal.database.pagination import keyset_page
+from internal.database.gridfs_stream import gridfs_file_response, upload_many_to_gridfs
+from internal.database.renditions import RENDITION_MEDIA_TYPE, get_rendition
+from internal.jobs.queue import job_queue
 from internal.tokens.dependencies import get_current_user
 from internal.utils.response import success_response
-from io import BytesIO
+from config.config import conf
 from fastapi import Form
 
 router = APIRouter(prefix="/api/reports", tags=["Reports"])
@@ -20,14 +24,10 @@ async def upload_report(
     advice: str = Form(...),
     current_user: dict = Depends(get_current_user)
 ):
-    image_bytes = await image.read()
-    pdf_bytes = await pdf.read()
-
-    image_stream = BytesIO(image_bytes)
-    pdf_stream = BytesIO(pdf_bytes)
-
-    image_file_id = await fs_bucket.upload_from_stream(image.filename, image_stream)
-    pdf_file_id = await fs_bucket.upload_from_stream(pdf.filename, pdf_stream)
+    image_file_id, pdf_file_id = await upload_many_to_gridfs(
+        (image, conf["report_max_image_bytes"]),
+        (pdf, conf["report_max_pdf_bytes"]),
+    )
 
     report_data = {
         "user_id": current_user["user_id"],
@@ -41,43 +41,70 @@ async def upload_report(
     }
 
     inserted = await report_collection.insert_one(report_data)
+    await job_queue.enqueue("render_report_renditions", {"report_id": str(inserted.inserted_id)})
     return success_response(data={"report_id": str(inserted.inserted_id)})
 
 
 
+REPORT_LIST_PROJECTION = {"label": 1, "confidence": 1, "risk_level": 1, "advice": 1, "created_at": 1}
+
+
 @router.get("/me")
-async def get_my_reports(current_user: dict = Depends(get_current_user)):
-    cursor = report_collection.find({"user_id": current_user["user_id"]}).sort("created_at", -1)
-    reports = []
-    async for report in cursor:
-        reports.append({
+async def get_my_reports(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    risk_level: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    query = {"user_id": current_user["user_id"]}
+    if risk_level:
+        query["risk_level"] = risk_level
+    if created_from or created_to:
+        query["created_at"] = {}
+        if created_from:
+            query["created_at"]["$gte"] = created_from
+        if created_to:
+            query["created_at"]["$lt"] = created_to
+
+    docs, next_cursor = await keyset_page(report_collection, query, REPORT_LIST_PROJECTION, limit, cursor)
+    reports = [
+        {
             "id": str(report["_id"]),
             "label": report["label"],
             "confidence": report["confidence"],
             "risk_level": report["risk_level"],
             "advice": report["advice"],
             "created_at": report["created_at"],
-        })
-    return success_response(data=reports)
+        }
+        for report in docs
+    ]
+    return success_response(data=reports, next_cursor=next_cursor)
 
 
 @router.get("/pdf/{report_id}")
-async def download_pdf(report_id: str, current_user: dict = Depends(get_current_user)):
+async def download_pdf(report_id: str, request: Request, current_user: dict = Depends(get_current_user)):
     report = await report_collection.find_one({"_id": ObjectId(report_id)})
     if not report or report["user_id"] != current_user["user_id"]:
         raise HTTPException(status_code=404, detail="PDF not found or unauthorized")
 
-    stream = await fs_bucket.open_download_stream(report["pdf_file_id"])
-    contents = await stream.read()
-    return StreamingResponse(BytesIO(contents), media_type="application/pdf")
+    return await gridfs_file_response(request, report["pdf_file_id"], media_type="application/pdf")
 
 
 @router.get("/image/{report_id}")
-async def get_image(report_id: str, current_user: dict = Depends(get_current_user)):
+async def get_image(
+    report_id: str,
+    request: Request,
+    size: Literal["original", "preview", "thumb"] = "original",
+    current_user: dict = Depends(get_current_user)
+):
     report = await report_collection.find_one({"_id": ObjectId(report_id)})
     if not report or report["user_id"] != current_user["user_id"]:
         raise HTTPException(status_code=404, detail="Image not found or unauthorized")
 
-    stream = await fs_bucket.open_download_stream(report["image_file_id"])
-    contents = await stream.read()
-    return StreamingResponse(BytesIO(contents), media_type="image/jpeg")
+    if size == "original":
+        return await gridfs_file_response(request, report["image_file_id"], media_type="image/jpeg")
+
+    file_id = await get_rendition(report, size)
+    return await gridfs_file_response(request, file_id, media_type=RENDITION_MEDIA_TYPE)
@@ -148,7 +148,7 @@ class _ReportsScreenState extends State<ReportsScreen> {
                   padding: const EdgeInsets.all(16),
                   itemBuilder: (context, index) {
                     final report = reports[index];
-                    final imageUrl = ApiEndpoints.getImage(report.id);
+                    final imageUrl = ApiEndpoints.getImage(report.id, size: 'thumb');
                     return Card(
                       color: _getRiskCardColor(report.riskLevel, isDark),
                       margin: const EdgeInsets.only(bottom: 16),
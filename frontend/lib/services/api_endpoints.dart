@@ -14,7 +14,7 @@ class ApiEndpoints {
 
   static final String uploadReport = '$baseUrl/api/reports/upload';
   static final String getMyReports = '$baseUrl/api/reports/me';
-  static String getImage(String reportId) =>
-      '$baseUrl/api/reports/image/$reportId';
+  static String getImage(String reportId, {String size = 'original'}) =>
+      '$baseUrl/api/reports/image/$reportId?size=$size';
   static String getPdf(String reportId) => '$baseUrl/api/reports/pdf/$reportId';
 }
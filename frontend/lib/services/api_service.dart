@@ -113,6 +113,7 @@ class ApiService {
     required String confirmNewPassword,
   }) async {
     final token = await getAccessToken();
+    final prefs = await SharedPreferences.getInstance();
     final response = await http.post(
       Uri.parse(ApiEndpoints.changePassword),
       headers: {
@@ -123,6 +124,8 @@ class ApiService {
         'old_password': oldPassword,
         'new_password': newPassword,
         'confirm_new_password': confirmNewPassword,
+        // Keeps this device signed in; every other session is revoked.
+        'refresh_token': prefs.getString('refresh_token'),
       }),
     );
 
@@ -163,18 +166,28 @@ class ApiService {
   static Future<List<ReportModel>> getReports() async {
     final prefs = await SharedPreferences.getInstance();
     final token = prefs.getString('access_token') ?? '';
-    final response = await http.get(
-      Uri.parse(ApiEndpoints.getMyReports),
-      headers: {'Authorization': 'Bearer $token'},
-    );
-
-    if (response.statusCode == 200) {
+    final reports = <ReportModel>[];
+    String? cursor;
+
+    do {
+      final uri = Uri.parse(ApiEndpoints.getMyReports).replace(
+        queryParameters: cursor == null ? null : {'cursor': cursor},
+      );
+      final response = await http.get(
+        uri,
+        headers: {'Authorization': 'Bearer $token'},
+      );
+
+      if (response.statusCode != 200) {
+        throw Exception('Failed to fetch reports');
+      }
       final data = jsonDecode(response.body);
       final List<dynamic> jsonList = data['data'];
-      return jsonList.map((json) => ReportModel.fromJson(json)).toList();
-    } else {
-      throw Exception('Failed to fetch reports');
-    }
+      reports.addAll(jsonList.map((json) => ReportModel.fromJson(json)));
+      cursor = data['next_cursor'];
+    } while (cursor != null);
+
+    return reports;
   }
 
   static Future<String> getAccessToken() async {